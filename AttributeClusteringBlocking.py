@@ -1,12 +1,14 @@
+from collections import defaultdict
 import numpy as np
-import networkx as nx
-from Blocking import TokenBlocker
+from Blocking import TokenBlocker, AttributeColumns
+from BlockCollection import BlockCollection
+from Instrumentation import Instrumented, Measure, BlockCounts
 
 def _tokenizeColumns(EC, transformationFun, column_index, token_name_prefix):
     """ Extracts tokens from each of the specified columns to their own collection, so that attribute clustering can be applied later on.
     Token name prefix is required to ensure the dictionary keys will be unique when tokens from multiple entity collections are combined."""
     tokens = {}
-    for i in column_index:
+    for i in AttributeColumns(EC, column_index):
         tokens[str(i)+token_name_prefix] = transformationFun(EC, i)
     return(tokens)
 
@@ -22,42 +24,111 @@ def JaccardSimilarity(set1, set2):
     return(len(set.intersection(set1, set2))/len(set.union(set1, set2)))
 
 
-def _linkAttributes(tokens1, tokens2, similarityFun):
-    """ From the two dictionaries of tokens, finds the attributes(columns) that are most similar between them, given a similarity function."""
+MINHASH_PRIME = (1 << 31) - 1
+MINHASH_CHUNK_SIZE = 4096
+LSH_MISS_PROBABILITY = 1e-6
+
+def _minHashSignatures(token_sets, num_perm=128, seed=0, chunk_size=MINHASH_CHUNK_SIZE):
+    """ MinHash signatures of token sets, as array of shape (number of sets, num_perm).
+    Tokens are interned to integers and hashed with num_perm random universal hash functions (a * x + b) mod p. Empty sets get signature of all p.
+    Tokens of a set are hashed chunk_size at a time into one num_perm x chunk_size buffer, keeping the running minimum of each hash function."""
+    ids = {}
+    encoded = [np.fromiter((ids.setdefault(token, len(ids)) for token in token_set), dtype=np.int64) for token_set in token_sets]
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MINHASH_PRIME, size=(num_perm, 1), dtype=np.int64)
+    b = rng.integers(0, MINHASH_PRIME, size=(num_perm, 1), dtype=np.int64)
+    signatures = np.full((len(token_sets), num_perm), MINHASH_PRIME, dtype=np.int64)
+    buffer = np.empty((num_perm, chunk_size), dtype=np.int64)
+    for i, tokens in enumerate(encoded):
+        for start in range(0, len(tokens), chunk_size):
+            chunk = tokens[start:start + chunk_size]
+            hashes = buffer[:, :len(chunk)]
+            np.multiply(a, chunk, out=hashes)
+            hashes += b
+            hashes %= MINHASH_PRIME
+            np.minimum(signatures[i], hashes.min(axis=1), out=signatures[i])
+    return signatures
+
+def _lshCandidates(signatures1, signatures2, bands):
+    """ LSH banding: signatures are split to bands, and sets of the two collections that have an identical band are candidate pairs.
+    Returns set of (index in collection 1, index in collection 2) pairs."""
+    num_perm = signatures1.shape[1]
+    if num_perm % bands != 0:
+        raise ValueError("Number of permutations must be divisible by number of bands")
+    rows = num_perm // bands
+    candidates = set()
+    for band in range(bands):
+        buckets = defaultdict(lambda: ([], []))
+        for side, signatures in enumerate((signatures1, signatures2)):
+            for i, signature in enumerate(signatures):
+                if signature[0] != MINHASH_PRIME:
+                    buckets[signature[band*rows:(band+1)*rows].tobytes()][side].append(i)
+        for members1, members2 in buckets.values():
+            candidates.update((i, j) for i in members1 for j in members2)
+    return candidates
+
+def _find(parent, x):
+    """ Union-find root of x, with path halving"""
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def _unionFindClusters(links):
+    """ Connected components of the graph given as dictionary of node -> list of linked nodes. Returns list of lists of nodes, in order of first appearance."""
+    parent = {}
+    for k in links:
+        parent.setdefault(k, k)
+        for k2 in links[k]:
+            parent.setdefault(k2, k2)
+            root1, root2 = _find(parent, k), _find(parent, k2)
+            if root1 != root2:
+                parent[root2] = root1
+    clusters = {}
+    for k in parent:
+        clusters.setdefault(_find(parent, k), []).append(k)
+    return list(clusters.values())
+
+def _linkAttributes(tokens1, tokens2, similarityFun, exhaustive=False, num_perm=128, bands=64, seed=0):
+    """ From the two dictionaries of tokens, finds the attributes(columns) that are most similar between them, given a similarity function.
+    Candidate attribute pairs are found with MinHash signatures of the attributes' token sets and LSH banding (num_perm hash functions in the given number of bands),
+    and the similarity function is evaluated only for the candidates. The defaults (64 bands of 2) find pairs with Jaccard similarity above ~0.15 with high probability.
+    Links of low similarity can be missed. With exhaustive=True an attribute whose most similar candidate is below the similarity
+    that LSH finds with probability 1 - LSH_MISS_PROBABILITY (~0.44 with the defaults), or that has no candidate, is compared with every attribute
+    of the other collection, so the links are the same as without LSH; in wide schemas of weakly similar attributes that is all pairs again.
+    Attributes without a similar attribute are left out (glue). Clusters are the connected components of the links, found with union-find."""
     flat_dict_tokens1 = _flattenTokenDict(tokens1)
     flat_dict_tokens2 = _flattenTokenDict(tokens2)
+    keys1 = list(flat_dict_tokens1)
+    keys2 = list(flat_dict_tokens2)
+    signatures = _minHashSignatures([flat_dict_tokens1[k] for k in keys1] + [flat_dict_tokens2[k] for k in keys2], num_perm, seed)
+    candidates = _lshCandidates(signatures[:len(keys1)], signatures[len(keys1):], bands)
+    similarity = lambda i, j: similarityFun(flat_dict_tokens1[keys1[i]], flat_dict_tokens2[keys2[j]])
+    similarities = {(i, j): similarity(i, j) for i, j in candidates}
+    # a more similar pair than one of similarity reliable is missed by all bands with probability at most LSH_MISS_PROBABILITY
+    reliable = (1 - LSH_MISS_PROBABILITY ** (1 / bands)) ** (bands / num_perm)
+    linked1 = {i for (i, j), sim in similarities.items() if sim >= reliable}
+    linked2 = {j for (i, j), sim in similarities.items() if sim >= reliable}
+    for i in range(len(keys1) if exhaustive else 0):
+        if i not in linked1:
+            similarities.update(((i, j), similarity(i, j)) for j in range(len(keys2)) if (i, j) not in similarities)
+    for j in range(len(keys2) if exhaustive else 0):
+        if j not in linked2:
+            similarities.update(((i, j), similarity(i, j)) for i in range(len(keys1)) if (i, j) not in similarities)
+    best = {}
+    for i, j in sorted(similarities):
+        sim = similarities[(i, j)]
+        for k, k2 in ((keys1[i], keys2[j]), (keys2[j], keys1[i])):
+            if sim > best.get(k, (0, None))[0]:
+                best[k] = (sim, k2)
     glue = []
     links = {}
-    for k in flat_dict_tokens1:
-        highest = 0
-        linkTo = -1
-        for k2 in flat_dict_tokens2:
-            sim = similarityFun(flat_dict_tokens1[k], flat_dict_tokens2[k2])
-            if(sim > highest):
-                highest = sim
-                linkTo = k2
-        if(highest>0):
-            links[k] = [linkTo]
+    for k in keys1 + keys2:
+        if k in best:
+            links[k] = [best[k][1]]
         else:
             glue.append(k)
-    for k in flat_dict_tokens2:
-        highest = 0
-        linkTo = -1
-        for k2 in flat_dict_tokens1:
-            sim = similarityFun(flat_dict_tokens2[k], flat_dict_tokens1[k2])
-            if(sim > highest):
-                highest = sim
-                linkTo = k2
-        if(highest>0):
-            links[k] = [linkTo]
-        else:
-            glue.append(k)  
-    clusters = []
-    g = nx.Graph(links)
-    g = g.to_undirected()
-    sub_graphs = nx.connected_component_subgraphs(g)
-    clusters = [sg.nodes() for sg in sub_graphs]
-    return(clusters)
+    return(_unionFindClusters(links))
 
 def mergeTokenLists(list1, list2):
     """ Merges two list of lists of tokens, given that the outer lists have same length"""
@@ -65,10 +136,8 @@ def mergeTokenLists(list1, list2):
     if(len(list1) != len(list2)):
         raise ValueError("List of tokens were not same size")
     else:
-        concatenated = list1
-        for i in range(0, len(list1)):
-            concatenated[i] = concatenated[i].extend(list2[i])
-    
+        return [tokens1 + tokens2 for tokens1, tokens2 in zip(list1, list2)]
+
 
 def ClusterBlocker(EC, clusters):
     """ Creates blocks of entities given the attribute clusters and tokens"""
@@ -90,23 +159,36 @@ def ClusterBlocker(EC, clusters):
 
 
 def _joinClusterBlocks(BC1, BC2):
-    """ Merges the blockings coming from the two entity collections, respects the attribute clustering"""
+    """ Merges the blockings coming from the two entity collections, respects the attribute clustering.
+    Returns BlockCollection where keys are cluster key + token"""
     combined = {}
     for clusterKey in BC1:
         if(clusterKey in BC2):
             for blockKey in BC1[clusterKey]:
                 if blockKey in BC2[clusterKey]:
                     combined[clusterKey+blockKey] = (BC1[clusterKey][blockKey],  BC2[clusterKey][blockKey])
-    return(combined)
+    return(BlockCollection.fromDict(combined))
     
 
 
-def AttributeClusteringBlocking(EntityCollection1, EntityCollection2, transformationFun, similarityFun, column_index=(1,2,3)):
-    """ Glues together the different parts of Attribute cluster blocking to a single pipeline. Returns a complete block collection."""
-    tokensEC1 = _tokenizeColumns(EntityCollection1, transformationFun, column_index, "_1")
-    tokensEC2 = _tokenizeColumns(EntityCollection2, transformationFun, column_index, "_2")
-    clusters = _linkAttributes(tokensEC1, tokensEC2, similarityFun)
-    clusterBlocks1 = ClusterBlocker(tokensEC1, clusters)
-    clusterBlocks2 = ClusterBlocker(tokensEC2, clusters)
-    blockCollection = _joinClusterBlocks(clusterBlocks1, clusterBlocks2)
+def _columnTokenCounts(result, *args):
+    return {"columns": len(result), "tokens": sum(len(tokens) for columnTokens in result.values() for tokens in columnTokens)}
+
+def _clusterCounts(result, *args):
+    return {"clusters": len(result)}
+
+def _clusterBlockCounts(result, *args):
+    return {"blocks": sum(len(blocks) for blocks in result.values())}
+
+@Instrumented("attribute clustering blocking", BlockCounts)
+def AttributeClusteringBlocking(EntityCollection1, EntityCollection2, transformationFun, similarityFun, column_index=(1,2,3), exhaustive=False):
+    """ Glues together the different parts of Attribute cluster blocking to a single pipeline. Returns a complete block collection.
+    column_index=None clusters all attribute columns (see Blocking.AttributeColumns). Each step is an instrumented stage, see Instrumentation.py
+    exhaustive=True also compares weakly linked attributes with all attributes of the other collection, see _linkAttributes."""
+    tokensEC1 = Measure("tokenization", _tokenizeColumns, EntityCollection1, transformationFun, column_index, "_1", counter=_columnTokenCounts, collection=1)
+    tokensEC2 = Measure("tokenization", _tokenizeColumns, EntityCollection2, transformationFun, column_index, "_2", counter=_columnTokenCounts, collection=2)
+    clusters = Measure("attribute clustering", _linkAttributes, tokensEC1, tokensEC2, similarityFun, exhaustive, counter=_clusterCounts)
+    clusterBlocks1 = Measure("cluster blocker", ClusterBlocker, tokensEC1, clusters, counter=_clusterBlockCounts, collection=1)
+    clusterBlocks2 = Measure("cluster blocker", ClusterBlocker, tokensEC2, clusters, counter=_clusterBlockCounts, collection=2)
+    blockCollection = Measure("join blocks", _joinClusterBlocks, clusterBlocks1, clusterBlocks2, counter=BlockCounts)
     return(blockCollection)
\ No newline at end of file
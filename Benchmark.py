@@ -0,0 +1,212 @@
+import os
+import sys
+import gc
+import csv
+import json
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from Blocking import TokenBlocking, TokenBlocker, MultiColumnTokenizer, ColumnTokenizer, EvaluateBlockCollection
+from AttributeClusteringBlocking import AttributeClusteringBlocking, JaccardSimilarity
+from BlockCleaning import BlockCleaning
+from Blockers import SchemaAgnosticBlocking, BLOCKERS
+from MetaBlocking import GraphBuilder, JaccardWeighting, CBSWeighting, WeightEdgePruning, CardinalityNodePruning, WeightedNodePruning, EvaluateMetaBlockCollection
+from Weighting import Weighting, WEIGHTING_SCHEMES
+from IdSpace import IdSpace
+from Instrumentation import StagePeaks, AddListener, LoggingListener
+
+# Benchmark of the blocking -> (block cleaning) -> graph building -> weighting -> pruning pipeline.
+# Every stage of every configured combination is recorded with its wall time, peak RSS of the process after the stage,
+# number of items it produced and number of Python objects tracked by the garbage collector, and the records are written as JSON or CSV.
+# Synthetic datasets are made by replicating the input collections (see ScaleDataset).
+
+DATASET = ("Amazon.csv", "GoogleProducts.csv", "Amzon_GoogleProducts_perfectMapping.csv")
+ENCODING = "ISO-8859-1"
+
+BLOCKINGS = {
+    'token': lambda EC1, EC2: TokenBlocking(EC1, EC2, MultiColumnTokenizer, TokenBlocker),
+    'ac': lambda EC1, EC2: AttributeClusteringBlocking(EC1, EC2, ColumnTokenizer, JaccardSimilarity)}
+# Character based blockers of the registry over all attribute columns, with their default block size limits
+BLOCKINGS.update({name: (lambda EC1, EC2, name=name: SchemaAgnosticBlocking(EC1, EC2, name)) for name in BLOCKERS if name != 'token'})
+
+PRUNINGS = {
+    'WEP': WeightEdgePruning,
+    'CNP': CardinalityNodePruning,
+    'WNP': WeightedNodePruning}
+
+# Weighting functions of the dictionary graph
+DICT_WEIGHTINGS = {
+    'CBS': CBSWeighting,
+    'JS': JaccardWeighting}
+
+
+def _itemCount(result):
+    """ Number of items produced by a stage: blocks, edges or comparisons"""
+    if hasattr(result, 'numEdges'):
+        return result.numEdges
+    if isinstance(result, dict) and 'edges' in result:
+        return len(result['edges'])
+    return len(result)
+
+def _measure(records, context, stage, fun, *args, countObjects=True):
+    """ Runs one stage, appends its record to records and returns the result of the stage"""
+    with StagePeaks() as peaks:
+        start = time.perf_counter()
+        result = fun(*args)
+        seconds = time.perf_counter() - start
+    record = dict(context)
+    record.update({
+        "stage": stage,
+        "seconds": seconds,
+        "peakRss": peaks["peakRss"],
+        "processPeakRss": peaks["processPeakRss"],
+        "items": _itemCount(result),
+        "pythonObjects": len(gc.get_objects()) if countObjects else None})
+    records.append(record)
+    return result
+
+def _evaluationRecord(records, context, stage, result):
+    record = dict(context)
+    record.update({"stage": stage, "pc": result.pc, "pq": result.pq, "rr": result.rr, "f1": result.f1,
+                   "comparisons": result.comparisons, "distinctComparisons": result.distinctComparisons})
+    records.append(record)
+
+def _dropRandomWord(text, rng):
+    words = text.split(" ")
+    if len(words) > 1:
+        del words[rng.integers(len(words))]
+    return " ".join(words)
+
+def ScaleEntityCollection(EC, factor, seed=0, column_index=(1,), noise=0.5):
+    """ Replicates an entity collection factor times. Primary keys of the copies get suffix '#copy number', the first copy is the original.
+    In the copies one random word is dropped from the given text columns with probability noise, so that the copies are not exact duplicates."""
+    rng = np.random.default_rng(seed)
+    copies = [EC]
+    for k in range(1, factor):
+        copy = EC.copy()
+        copy[:, 0] = [str(pk) + "#" + str(k) for pk in EC[:, 0]]
+        for column in column_index:
+            values = copy[:, column]
+            for i in np.flatnonzero(rng.random(len(values)) < noise):
+                if isinstance(values[i], str):
+                    values[i] = _dropRandomWord(values[i], rng)
+        copies.append(copy)
+    return np.concatenate(copies)
+
+def ScaleDataset(EntityCollection1, EntityCollection2, goldStandard, factor, seed=0):
+    """ Synthetic dataset of factor times the size of the given one. Gold standard pairs are replicated between the copies with the same number."""
+    scaledGold = [goldStandard] + [np.array([[str(a) + "#" + str(k), str(b) + "#" + str(k)] for a, b in goldStandard], dtype=object) for k in range(1, factor)]
+    return (ScaleEntityCollection(EntityCollection1, factor, seed),
+            ScaleEntityCollection(EntityCollection2, factor, seed + 1),
+            np.concatenate(scaledGold))
+
+def LoadDataset(directory=".", factor=1, seed=0):
+    """ Reads the bundled Amazon/GoogleProducts dataset from directory, scaled by factor"""
+    EC1, EC2, gold = [pd.read_csv(os.path.join(directory, name), encoding=ENCODING).values for name in DATASET]
+    if factor > 1:
+        return ScaleDataset(EC1, EC2, gold, factor, seed)
+    return EC1, EC2, gold
+
+def WriteDataset(EntityCollection1, EntityCollection2, goldStandard, directory, columns=(("id", "title", "description", "manufacturer", "price"),
+                                                                                        ("id", "name", "description", "manufacturer", "price"),
+                                                                                        ("idAmazon", "idGoogleBase"))):
+    """ Writes a (synthetic) dataset as csv files with the names of the bundled dataset"""
+    os.makedirs(directory, exist_ok=True)
+    for data, name, header in zip((EntityCollection1, EntityCollection2, goldStandard), DATASET, columns):
+        pd.DataFrame(data, columns=header).to_csv(os.path.join(directory, name), index=False, encoding=ENCODING)
+
+def RunBenchmark(EntityCollection1, EntityCollection2, goldStandard, blockings=('token', 'ac'), weightings=('CBS', 'JS'), prunings=('WEP', 'CNP'),
+                 backend='sparse', maxComparisons=None, filteringRatio=0.8, evaluate=True, countObjects=True, context=None):
+    """ Runs every combination of the given blocking methods, weighting schemes and pruning methods and returns list of stage records.
+    Block collection, graph and weights are computed once and shared by the combinations that use them.
+    If maxComparisons is given, blocks are cleaned (BlockCleaning.BlockCleaning) before the graph is built.
+    All graphs of the run share one IdSpace of the entity collections."""
+    records = []
+    context = dict(context or {})
+    idSpace = IdSpace.fromCollections(EntityCollection1, EntityCollection2)
+    for blocking in blockings:
+        blockContext = dict(context, blocking=blocking)
+        blockCollection = _measure(records, blockContext, "blocking", BLOCKINGS[blocking], EntityCollection1, EntityCollection2, countObjects=countObjects)
+        if maxComparisons is not None:
+            blockCollection = _measure(records, blockContext, "cleaning", BlockCleaning, blockCollection, maxComparisons, filteringRatio, countObjects=countObjects)
+        if evaluate:
+            result = EvaluateBlockCollection(EntityCollection1, EntityCollection2, blockCollection, goldStandard, verbose=False)
+            _evaluationRecord(records, blockContext, "blocking evaluation", result)
+        graph = _measure(records, blockContext, "graph", GraphBuilder, blockCollection, backend, idSpace, countObjects=countObjects)
+        for weighting in weightings:
+            weightContext = dict(blockContext, weighting=weighting)
+            if backend == 'sparse':
+                weighted = _measure(records, weightContext, "weighting", Weighting, graph, weighting, countObjects=countObjects)
+            else:
+                weighted = _measure(records, weightContext, "weighting", DICT_WEIGHTINGS[weighting], graph, countObjects=countObjects)
+            for pruning in prunings:
+                pruneContext = dict(weightContext, pruning=pruning)
+                comparisons = _measure(records, pruneContext, "pruning", PRUNINGS[pruning], weighted, countObjects=countObjects)
+                if evaluate:
+                    result = EvaluateMetaBlockCollection(EntityCollection1, EntityCollection2, comparisons, goldStandard, verbose=False, idSpace=idSpace)
+                    _evaluationRecord(records, pruneContext, "pruning evaluation", result)
+    return records
+
+def WriteRecords(records, path):
+    """ Writes the records as JSON list, or as CSV if path ends with .csv"""
+    if path.endswith(".csv"):
+        fields = []
+        for record in records:
+            fields.extend(key for key in record if key not in fields)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, "w") as f:
+            json.dump(records, f, indent=1)
+
+def PrintRecords(records):
+    """ Prints the records as a table"""
+    print(pd.DataFrame(records).to_string(index=False))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark blocking and meta-blocking combinations on the Amazon/GoogleProducts dataset and synthetic scaled-up versions of it.")
+    parser.add_argument("--data", default=".", help="directory of the dataset csv files")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1], help="scale factors of synthetic datasets, e.g. 1 10 100 1000")
+    parser.add_argument("--blocking", nargs="+", default=['token', 'ac'], choices=sorted(BLOCKINGS))
+    parser.add_argument("--weighting", nargs="+", default=['CBS', 'JS'], choices=sorted(WEIGHTING_SCHEMES))
+    parser.add_argument("--pruning", nargs="+", default=['WEP', 'CNP'], choices=sorted(PRUNINGS))
+    parser.add_argument("--backend", default='sparse', choices=['sparse', 'dict'], help="GraphBuilder backend")
+    parser.add_argument("--max-comparisons", type=int, default=None, help="clean blocks with block purging and filtering before building the graph")
+    parser.add_argument("--filtering-ratio", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-evaluation", action="store_true", help="skip evaluation against the gold standard")
+    parser.add_argument("--no-object-count", action="store_true", help="skip counting Python objects after each stage")
+    parser.add_argument("--write-datasets", default=None, help="only write the synthetic datasets to this directory, one subdirectory per scale")
+    parser.add_argument("--log-stages", action="store_true", help="log the instrumented sub-stages (tokenization, blocking, weighting...) to stderr")
+    parser.add_argument("--label", default="", help="label stored in every record, e.g. version being benchmarked")
+    parser.add_argument("--output", default=None, help="output file, .json or .csv")
+    args = parser.parse_args(argv)
+    unsupported = [scheme for scheme in args.weighting if scheme not in DICT_WEIGHTINGS]
+    if args.backend == 'dict' and unsupported:
+        parser.error("--backend dict supports only the weightings {0}, not {1}".format(", ".join(sorted(DICT_WEIGHTINGS)), ", ".join(unsupported)))
+    if args.log_stages:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        AddListener(LoggingListener())
+
+    records = []
+    for scale in args.scales:
+        EC1, EC2, gold = LoadDataset(args.data, scale, args.seed)
+        if args.write_datasets is not None:
+            WriteDataset(EC1, EC2, gold, os.path.join(args.write_datasets, "x" + str(scale)))
+            continue
+        context = {"label": args.label, "scale": scale, "entities1": len(EC1), "entities2": len(EC2)}
+        records.extend(RunBenchmark(EC1, EC2, gold, args.blocking, args.weighting, args.pruning, args.backend,
+                                    args.max_comparisons, args.filtering_ratio, not args.no_evaluation, not args.no_object_count, context))
+    if records:
+        if args.output is not None:
+            WriteRecords(records, args.output)
+        else:
+            PrintRecords(records)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
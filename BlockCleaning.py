@@ -0,0 +1,58 @@
+import numpy as np
+from BlockCollection import BlockCollection
+
+# Block cleaning methods applied to a block collection between blocking (_joinBlocks, _joinClusterBlocks) and GraphBuilder.
+# They take either a BlockCollection or the dictionary of key -> (entities of collection 1, entities of collection 2)
+# and return the same type, so they can be chained and used with any of the blocking methods.
+
+
+def _sameType(original, blockCollection):
+    """ Returns the cleaned block collection as dictionary if the original one was a dictionary"""
+    return blockCollection if isinstance(original, BlockCollection) else blockCollection.toDict()
+
+def _keepPostings(bc, keep1, keep2):
+    """ Returns a new BlockCollection with only the postings selected by boolean masks keep1 and keep2, dropping blocks left without entities on either side"""
+    numBlocks = len(bc)
+    offsets1 = np.zeros(numBlocks + 1, dtype=np.int64)
+    offsets2 = np.zeros(numBlocks + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bc.blockIds1()[keep1], minlength=numBlocks), out=offsets1[1:])
+    np.cumsum(np.bincount(bc.blockIds2()[keep2], minlength=numBlocks), out=offsets2[1:])
+    filtered = BlockCollection(bc.blockKeys, offsets1, bc.entities1[keep1], offsets2, bc.entities2[keep2], bc.size1, bc.size2)
+    sizes1, sizes2 = filtered.blockSizes()
+    return filtered.subset(np.flatnonzero((sizes1 > 0) & (sizes2 > 0)))
+
+def _filterPostings(entities, blockIds, blockRank, ratio):
+    """ Marks the postings of each entity that are in its ceil(ratio * number of blocks) lowest ranked blocks"""
+    order = np.lexsort((blockRank[blockIds], entities))
+    sortedEntities = entities[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sortedEntities)) + 1))
+    counts = np.diff(np.concatenate((starts, [len(order)])))
+    rankInEntity = np.arange(len(order)) - np.repeat(starts, counts)
+    limits = np.repeat(np.ceil(counts * ratio), counts)
+    keep = np.zeros(len(entities), dtype=bool)
+    keep[order] = rankInEntity < limits
+    return keep
+
+def BlockPurging(blockCollection, maxComparisons):
+    """ Size-based block purging: removes the blocks that contain more than maxComparisons comparisons (|b1| * |b2|).
+    These are the blocks of very frequent tokens, which add many comparisons and few matches."""
+    bc = BlockCollection.fromDict(blockCollection)
+    comparisons = bc.comparisons()
+    purged = bc.subset(np.flatnonzero((comparisons > 0) & (comparisons <= maxComparisons)))
+    return _sameType(blockCollection, purged)
+
+def BlockFiltering(blockCollection, ratio=0.8):
+    """ Block filtering: keeps each entity only in the ratio (0..1] of its blocks that have the fewest comparisons, at least in one block.
+    Blocks with equal number of comparisons are ordered by their position in the block collection. Blocks left empty on either side are removed."""
+    if not 0 < ratio <= 1:
+        raise ValueError("Filtering ratio must be in (0, 1]")
+    bc = BlockCollection.fromDict(blockCollection)
+    blockRank = np.empty(len(bc), dtype=np.int64)
+    blockRank[np.argsort(bc.comparisons(), kind='stable')] = np.arange(len(bc))
+    keep1 = _filterPostings(bc.entities1, bc.blockIds1(), blockRank, ratio)
+    keep2 = _filterPostings(bc.entities2, bc.blockIds2(), blockRank, ratio)
+    return _sameType(blockCollection, _keepPostings(bc, keep1, keep2))
+
+def BlockCleaning(blockCollection, maxComparisons, ratio=0.8):
+    """ Block purging followed by block filtering"""
+    return BlockFiltering(BlockPurging(blockCollection, maxComparisons), ratio)
@@ -0,0 +1,141 @@
+from itertools import chain
+import numpy as np
+
+
+def _toCSR(lists):
+    """ Concatenates a sequence of lists of entity indices to (offsets, indices) arrays"""
+    lists = list(lists)
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(l) for l in lists], out=offsets[1:])
+    indices = np.fromiter(chain.from_iterable(lists), dtype=np.int32, count=offsets[-1])
+    return offsets, indices
+
+def _gatherCSR(offsets, indices, rows):
+    """ Selects rows of a CSR structure, returns new (offsets, indices) arrays"""
+    lengths = offsets[rows + 1] - offsets[rows]
+    newOffsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=newOffsets[1:])
+    # position of each selected element in the original indices array
+    positions = np.repeat(offsets[rows] - newOffsets[:-1], lengths) + np.arange(newOffsets[-1])
+    return newOffsets, indices[positions]
+
+
+class BlockCollection:
+    """ Block collection of two entity collections with integer encoded blocks.
+    Block keys (e.g. tokens) are interned to block ids 0..N-1 and the entities of each side are stored as CSR arrays:
+    entities of collection 1 in block b are entities1[offsets1[b]:offsets1[b+1]], and the same for collection 2.
+    Has the same read API as the dictionary of key -> (entities of collection 1, entities of collection 2) used before,
+    except that the two parts of a block are NumPy arrays instead of lists."""
+
+    def __init__(self, keys, offsets1, entities1, offsets2, entities2, size1=None, size2=None):
+        self.blockKeys = list(keys)
+        self.offsets1 = np.asarray(offsets1, dtype=np.int64)
+        self.entities1 = np.asarray(entities1, dtype=np.int32)
+        self.offsets2 = np.asarray(offsets2, dtype=np.int64)
+        self.entities2 = np.asarray(entities2, dtype=np.int32)
+        if len(self.offsets1) != len(self.blockKeys) + 1 or len(self.offsets2) != len(self.blockKeys) + 1:
+            raise ValueError("Offsets do not match the number of blocks")
+        # Number of entities in the collections, defaults to the largest index in the blocks + 1
+        self.size1 = size1 if size1 is not None else (int(self.entities1.max()) + 1 if len(self.entities1) else 0)
+        self.size2 = size2 if size2 is not None else (int(self.entities2.max()) + 1 if len(self.entities2) else 0)
+        self._index = None
+
+    @classmethod
+    def fromDict(cls, blockCollection, size1=None, size2=None):
+        """ Makes a block collection from dictionary of key -> (list of entities of collection 1, list of entities of collection 2)"""
+        if isinstance(blockCollection, cls):
+            return blockCollection
+        keys = list(blockCollection)
+        offsets1, entities1 = _toCSR(blockCollection[key][0] for key in keys)
+        offsets2, entities2 = _toCSR(blockCollection[key][1] for key in keys)
+        return cls(keys, offsets1, entities1, offsets2, entities2, size1, size2)
+
+    @classmethod
+    def fromPostings(cls, keys1, offsets1, entities1, keys2, offsets2, entities2, size1=None, size2=None):
+        """ Joins two blocking indexes given in CSR form (block keys, offsets, entities), keeping only keys found in both.
+        Blocks are in the order of the first index."""
+        keys1 = np.asarray(keys1)
+        keys2 = np.asarray(keys2)
+        common, rows1, rows2 = np.intersect1d(keys1, keys2, assume_unique=True, return_indices=True)
+        order = np.argsort(rows1)
+        rows1 = rows1[order]
+        rows2 = rows2[order]
+        newOffsets1, newEntities1 = _gatherCSR(np.asarray(offsets1), np.asarray(entities1), rows1)
+        newOffsets2, newEntities2 = _gatherCSR(np.asarray(offsets2), np.asarray(entities2), rows2)
+        return cls(keys1[rows1].tolist(), newOffsets1, newEntities1, newOffsets2, newEntities2, size1, size2)
+
+    def _blockId(self, key):
+        if self._index is None:
+            self._index = {k: i for i, k in enumerate(self.blockKeys)}
+        return self._index[key]
+
+    def block(self, b):
+        """ Returns the block with id b as tuple of two arrays of entity indices"""
+        return (self.entities1[self.offsets1[b]:self.offsets1[b+1]], self.entities2[self.offsets2[b]:self.offsets2[b+1]])
+
+    def __getitem__(self, key):
+        return self.block(self._blockId(key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self._blockId(key)
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return len(self.blockKeys)
+
+    def __iter__(self):
+        return iter(self.blockKeys)
+
+    def keys(self):
+        return list(self.blockKeys)
+
+    def values(self):
+        return [self.block(b) for b in range(len(self))]
+
+    def items(self):
+        return [(key, self.block(b)) for b, key in enumerate(self.blockKeys)]
+
+    def toDict(self):
+        """ Converts back to dictionary of key -> (list, list)"""
+        return {key: (block[0].tolist(), block[1].tolist()) for key, block in self.items()}
+
+    def blockSizes(self):
+        """ Returns number of entities of collection 1 and collection 2 in each block, as two arrays"""
+        return np.diff(self.offsets1), np.diff(self.offsets2)
+
+    def comparisons(self):
+        """ Number of comparisons in each block"""
+        sizes1, sizes2 = self.blockSizes()
+        return sizes1 * sizes2
+
+    def blockIds1(self):
+        """ Block id of each element of entities1"""
+        return np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets1))
+
+    def blockIds2(self):
+        """ Block id of each element of entities2"""
+        return np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets2))
+
+    def subset(self, blockIds):
+        """ Returns a new block collection with only the given blocks, in the given order"""
+        blockIds = np.asarray(blockIds, dtype=np.int64)
+        offsets1, entities1 = _gatherCSR(self.offsets1, self.entities1, blockIds)
+        offsets2, entities2 = _gatherCSR(self.offsets2, self.entities2, blockIds)
+        return BlockCollection([self.blockKeys[b] for b in blockIds], offsets1, entities1, offsets2, entities2, self.size1, self.size2)
+
+    @property
+    def nbytes(self):
+        """ Memory used by the posting arrays"""
+        return self.offsets1.nbytes + self.entities1.nbytes + self.offsets2.nbytes + self.entities2.nbytes
+
+    def __repr__(self):
+        return "BlockCollection({0} blocks, {1} + {2} postings)".format(len(self), len(self.entities1), len(self.entities2))
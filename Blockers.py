@@ -0,0 +1,117 @@
+import re
+from collections import namedtuple
+from itertools import chain, combinations
+from scipy.special import comb
+import numpy as np
+import pandas as pd
+from Tokenization import TokenizeTexts, stopSet
+from TokenCache import EncodeTokenLists, InvertTokenIds
+from BlockCollection import BlockCollection
+from BlockCleaning import BlockPurging
+from Blocking import AttributeColumns
+from Instrumentation import Instrumented, BlockCounts
+
+# Registry of schema-agnostic blocking methods. A blocker is a key function that turns the text of each entity
+# (all its attribute values, or the selected columns, joined with " ") into a list of block keys.
+# Keys of both collections are encoded to integer ids and inverted to CSR postings (see TokenCache.InvertTokenIds),
+# and the postings are joined to a BlockCollection like in token blocking.
+# Character based keys make many large blocks, so every blocker has a limit on the number of entities in a block (maxBlockSize),
+# larger blocks are dropped; blocks can also be purged by their number of comparisons (see BlockCleaning.BlockPurging).
+# Registered blockers:
+# 'token': tokens of Tokenization (lower case, stopwords removed, stemmed)
+# 'qgram': character q-grams of the words
+# 'extended-qgram': q-grams of the words and concatenations of at least threshold * (number of q-grams) of the q-grams of a word, in order,
+#     so that words differing by a character or two still share keys
+# 'suffix': suffixes of at least min_length characters of the words (suffix array blocking)
+
+Blocker = namedtuple("Blocker", ["keys", "maxBlockSize", "options"])
+
+BLOCKERS = {}
+
+
+def RegisterBlocker(name, keyFunction, maxBlockSize=None, **options):
+    """ Registers a blocker: keyFunction(texts, **options) returns list of block keys of each text.
+    maxBlockSize is the default limit of entities in a block (None for no limit), options are the default options of keyFunction."""
+    BLOCKERS[name] = Blocker(keyFunction, maxBlockSize, options)
+
+def _words(text):
+    """ Lower case alphanumeric words of a text without stopwords"""
+    return [word for word in re.findall(r"[^\W_]+", text.lower()) if word not in stopSet]
+
+def _qgrams(word, q):
+    if len(word) <= q:
+        return [word]
+    return [word[i:i + q] for i in range(len(word) - q + 1)]
+
+def _combinationCount(numGrams, omitted):
+    """ Number of combinations of numGrams q-grams with at most omitted of them left out"""
+    return sum(comb(numGrams, i, exact=True) for i in range(omitted + 1))
+
+def _extendedQGrams(word, q, threshold, max_qgrams):
+    """ q-grams of a word and concatenations of combinations of them, leaving out at most (1 - threshold) of the q-grams.
+    The number of combinations grows exponentially, so words with more than max_qgrams q-grams leave out fewer q-grams,
+    as many as keep the number of combinations within that of a word of max_qgrams q-grams."""
+    grams = _qgrams(word, q)
+    omitted = len(grams) - max(1, int(len(grams) * threshold))
+    if len(grams) > max_qgrams:
+        budget = _combinationCount(max_qgrams, max_qgrams - max(1, int(max_qgrams * threshold)))
+        omitted = min(omitted, max(i for i in range(omitted + 1) if _combinationCount(len(grams), i) <= budget))
+    combined = ("".join(sublist) for length in range(len(grams) - omitted, len(grams) + 1) for sublist in combinations(grams, length))
+    return list(dict.fromkeys(chain(grams, combined)))
+
+def _suffixes(word, min_length):
+    return [word[i:] for i in range(len(word) - min_length + 1)]
+
+def TokenBlockingKeys(texts, processes=None):
+    return TokenizeTexts(texts, processes)
+
+def QGramKeys(texts, q=3):
+    return [list(dict.fromkeys(gram for word in _words(text) for gram in _qgrams(word, q))) for text in texts]
+
+def ExtendedQGramKeys(texts, q=3, threshold=0.8, max_qgrams=12):
+    return [list(dict.fromkeys(key for word in _words(text) for key in _extendedQGrams(word, q, threshold, max_qgrams))) for text in texts]
+
+def SuffixKeys(texts, min_length=4):
+    return [list(dict.fromkeys(suffix for word in _words(text) for suffix in _suffixes(word, min_length))) for text in texts]
+
+RegisterBlocker('token', TokenBlockingKeys, maxBlockSize=None)
+RegisterBlocker('qgram', QGramKeys, maxBlockSize=500, q=3)
+RegisterBlocker('extended-qgram', ExtendedQGramKeys, maxBlockSize=200, q=3, threshold=0.8, max_qgrams=12)
+RegisterBlocker('suffix', SuffixKeys, maxBlockSize=100, min_length=4)
+
+
+def EntityTexts(EC, column_index=None):
+    """ Text of each entity: the values of the columns (all attribute columns if None) joined with " ", missing values left out"""
+    values = EC[:, np.atleast_1d(AttributeColumns(EC, column_index))]
+    missing = pd.isna(values)
+    return [" ".join(str(value) for value, isMissing in zip(row, rowMissing) if not isMissing) for row, rowMissing in zip(values, missing)]
+
+def _postings(keyLists):
+    vocabulary, keyIds, offsets = EncodeTokenLists(keyLists)
+    postingOffsets, postings = InvertTokenIds(keyIds, offsets, len(vocabulary))
+    return vocabulary, postingOffsets, postings
+
+def _limitBlockSize(blockCollection, maxBlockSize):
+    sizes1, sizes2 = blockCollection.blockSizes()
+    return blockCollection.subset(np.flatnonzero(sizes1 + sizes2 <= maxBlockSize))
+
+@Instrumented("schema-agnostic blocking", BlockCounts)
+def SchemaAgnosticBlocking(EntityCollection1, EntityCollection2, blocker='token', column_index=None, maxBlockSize='default', maxComparisons=None, **options):
+    """ Blocks two entity collections with a registered blocker (see BLOCKERS), using the columns column_index or all attribute columns.
+    Blocks with more than maxBlockSize entities ('default' is the blocker's own limit, None for no limit)
+    and, if maxComparisons is given, blocks with more comparisons are dropped. options override the blocker's options, e.g. q=2.
+    Returns BlockCollection."""
+    if blocker not in BLOCKERS:
+        raise ValueError("Unknown blocker: {0}".format(blocker))
+    keyFunction, defaultMaxBlockSize, defaultOptions = BLOCKERS[blocker]
+    options = dict(defaultOptions, **options)
+    if maxBlockSize == 'default':
+        maxBlockSize = defaultMaxBlockSize
+    keys1, offsets1, postings1 = _postings(keyFunction(EntityTexts(EntityCollection1, column_index), **options))
+    keys2, offsets2, postings2 = _postings(keyFunction(EntityTexts(EntityCollection2, column_index), **options))
+    blockCollection = BlockCollection.fromPostings(keys1, offsets1, postings1, keys2, offsets2, postings2, len(EntityCollection1), len(EntityCollection2))
+    if maxBlockSize is not None:
+        blockCollection = _limitBlockSize(blockCollection, maxBlockSize)
+    if maxComparisons is not None:
+        blockCollection = BlockPurging(blockCollection, maxComparisons)
+    return blockCollection
@@ -1,36 +1,32 @@
 import pandas
 import numpy as np
-import nltk
-from nltk.stem import LancasterStemmer
-nltk.download('stopwords')
-nltk.download("punkt")
-from nltk.corpus import stopwords
-stop = stopwords.words('english')
-lancaster = LancasterStemmer()
+from Tokenization import stop, lancaster, TokenizeTexts
+from BlockCollection import BlockCollection
+from Evaluation import GoldStandardIndices, EvaluateBlocks, FormatResult
+from Instrumentation import Instrumented, Measure, TokenCounts, KeyCounts, BlockCounts
 
 
-def ColumnTokenizer(EC, column_index=1):
+def AttributeColumns(EC, column_index=None):
+    """ Columns to tokenize: column_index, or every column except the primary key (first column) if None, so the blocking does not depend on the schema"""
+    if column_index is None:
+        return tuple(range(1, EC.shape[1]))
+    return column_index
+
+def ColumnTokenizer(EC, column_index=1, processes=None):
     """Extract tokens from specified column of each entity
-    Makes each token lower case, removes (english) stopwords and applies lancaster stemming"""
-    titles = EC[:,column_index].astype(str)
-    stemmed = []
-    for title in titles:
-        tokens = nltk.word_tokenize(title.lower())
-        filtered = set([token for token in tokens if token not in stop and len(token)>1])
-        stemmed.append([lancaster.stem(token) for token in filtered])
-    return stemmed
-
-def MultiColumnTokenizer(EC, column_index = (1,2,3)):
+    Makes each token lower case, removes (english) stopwords and applies lancaster stemming.
+    Tokenization runs in chunks over a pool of processes, see Tokenization.TokenizeTexts"""
+    # values are converted one by one, astype(str) would copy the column to a fixed-width unicode array as wide as its longest value
+    titles = [str(value) for value in EC[:,column_index]]
+    return TokenizeTexts(titles, processes)
+
+def MultiColumnTokenizer(EC, column_index = (1,2,3), processes=None):
     """Extract tokens from specified columns of each entity
-    Makes each token lower case, removes (english) stopwords and applies lancaster stemming"""
-    titles = EC[:,column_index].astype(str)
-    stemmed = []
-    for title in titles:
-        title = " ".join(title)
-        tokens = nltk.word_tokenize(title.lower())
-        filtered = set([token for token in tokens if token not in stop and len(token)>1])
-        stemmed.append([lancaster.stem(token) for token in filtered])
-    return stemmed
+    Makes each token lower case, removes (english) stopwords and applies lancaster stemming.
+    Tokenization runs in chunks over a pool of processes, see Tokenization.TokenizeTexts
+    column_index=None uses all attribute columns, see AttributeColumns"""
+    titles = [" ".join(map(str, title)) for title in EC[:,AttributeColumns(EC, column_index)]]
+    return TokenizeTexts(titles, processes)
 
 
 def TokenBlocker(tokenArray):
@@ -47,41 +43,31 @@ def TokenBlocker(tokenArray):
 
 def _joinBlocks(BC1, BC2):
     """ Joins block collections made from two different entity collections.
-    Returns dictionary where tokens are keys and values are tuples containing lists of index values of entites having that token.
-    First list of the tuple is the indices coming from entity collection 1 and second list comes from entity collection 2.
+    Returns BlockCollection where tokens are keys and values are tuples containing arrays of index values of entites having that token.
+    First array of the tuple is the indices coming from entity collection 1 and second array comes from entity collection 2.
     If some token is not found from both entity collections it is not added. """
-    combined = {}
-    for key in BC1:
-        if(key in BC2):
-            combined[key] = (BC1[key], BC2[key])
-    return(combined)
+    combined = {key: (BC1[key], BC2[key]) for key in BC1 if key in BC2}
+    return(BlockCollection.fromDict(combined))
 
+@Instrumented("token blocking", BlockCounts)
 def TokenBlocking(EntityCollection1, EntityCollection2, transformationFun, constraintFun):
     """Glues together the different functions required to do token blocking.
-    Input consists of two entity collections, a transformation function and a constrain function """
-    transformedEC1 = transformationFun(EntityCollection1)
-    transformedEC2 = transformationFun(EntityCollection2)
+    Input consists of two entity collections, a transformation function and a constrain function
+    Each step is an instrumented stage, see Instrumentation.py """
+    transformedEC1 = Measure("tokenization", transformationFun, EntityCollection1, counter=TokenCounts, collection=1)
+    transformedEC2 = Measure("tokenization", transformationFun, EntityCollection2, counter=TokenCounts, collection=2)
 
-    blockedEC1 = constraintFun(transformedEC1)
-    blockedEC2 = constraintFun(transformedEC2)
+    blockedEC1 = Measure("token blocker", constraintFun, transformedEC1, counter=KeyCounts, collection=1)
+    blockedEC2 = Measure("token blocker", constraintFun, transformedEC2, counter=KeyCounts, collection=2)
 
-    blockCollection = _joinBlocks(blockedEC1, blockedEC2)
+    blockCollection = Measure("join blocks", _joinBlocks, blockedEC1, blockedEC2, counter=BlockCounts)
     return(blockCollection)
 
 
 def _goldStandardToIndexArray(EntityCollection1, EntityCollection2, goldStandard):
     """Extracts all the required comparisons from the gold standard and maps them to indices in the original entity collections. 
     Returns the comparisons as list of tuples. """
-    s = goldStandard.shape
-    N = s[0]
-    goldStandardIndices = np.ndarray(shape=s, dtype=np.int32)
-    pk1 = EntityCollection1[:, 0]
-    pk2 = EntityCollection2[:, 0]
-    for i in np.arange(N):
-        # Those are supposed to be primary keys so there should ever be only one match
-        goldStandardIndices[i, 0] =  np.where(pk1 == goldStandard[i, 0])[0]
-        goldStandardIndices[i, 1] =  np.where(pk2 == goldStandard[i, 1])[0]
-    return(list(map(tuple, goldStandardIndices)))
+    return(list(map(tuple, GoldStandardIndices(EntityCollection1, EntityCollection2, goldStandard).tolist())))
 
 def _reduceBlockToComparisons(block):
     """Given a block as tuple of two arrays of indices, constructs all the pairwise comparisons.
@@ -101,15 +87,10 @@ def _reduceBlockCollectionToComparisons(bc):
     return(comparisons)
 
 
-def EvaluateBlockCollection(EntityCollection1, EntityCollection2, blockCollection, goldStandard):
-    """Evaluate a block collection against gold standard. Calculates pair completenes, reduction ratio (vs. brute force)  and reduction ratio with redundancy pruning (vs. brute force)"""
-    gsIndexArray = _goldStandardToIndexArray(EntityCollection1, EntityCollection2, goldStandard)
-    comparisons = _reduceBlockCollectionToComparisons(blockCollection)
-    unique_comparisons = set(comparisons)
-    matches = [comparison for comparison in gsIndexArray if comparison in unique_comparisons]
-    pc = len(matches)/len(gsIndexArray)*100
-    rr1 = (1 - len(comparisons)/(len(EntityCollection1)*len(EntityCollection2)))*100
-    rr2 = (1 - len(unique_comparisons)/(len(EntityCollection1)*len(EntityCollection2)))*100
-    print("Pair Completenes: {0:.2f}%\n Reduction Ratio: {1:.2f}%\n Reduction Ratio (with redundant pruned): {2:.2f}%\n".format(pc, rr1,rr2 ))
-
-
+def EvaluateBlockCollection(EntityCollection1, EntityCollection2, blockCollection, goldStandard, verbose=True):
+    """Evaluate a block collection against gold standard. Calculates pair completenes, pair quality, reduction ratio (vs. brute force)  and reduction ratio with redundancy pruning (vs. brute force)
+    Comparisons are counted from block sizes and sparse products without enumerating them, see Evaluation.EvaluateBlocks. Returns the measures as EvaluationResult."""
+    result = EvaluateBlocks(EntityCollection1, EntityCollection2, blockCollection, goldStandard)
+    if verbose:
+        print(FormatResult(result))
+    return result
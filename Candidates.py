@@ -0,0 +1,97 @@
+import os
+import numpy as np
+
+# Columnar candidate pairs for handing the output of meta-blocking to a matcher without building Python objects per pair.
+# A candidate is a pair of row indices (entity of collection 1, entity of collection 2), not shifted by any offset, stored as int32 arrays,
+# with an optional float64 weight. Candidates can be written as .npy files that are loaded memory-mapped,
+# or as Arrow/Parquet files with the primary keys of the entities (requires pyarrow, which is optional).
+
+
+class CandidatePairs:
+    """ Candidate pairs as columns: left (row indices of collection 1), right (row indices of collection 2) and weights (None if not weighted)"""
+
+    def __init__(self, left, right, weights=None):
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+        if len(self.left) != len(self.right) or (self.weights is not None and len(self.weights) != len(self.left)):
+            raise ValueError("Candidate columns have different lengths")
+
+    @classmethod
+    def fromTuples(cls, pairs, offset=0, weights=None):
+        """ Candidates from a list of (i, j) tuples or (n, 2) array, j shifted by offset like in the output of the pruning functions"""
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        return cls(pairs[:, 0], pairs[:, 1] - offset, weights)
+
+    def __len__(self):
+        return len(self.left)
+
+    def __repr__(self):
+        return "CandidatePairs({0} pairs{1})".format(len(self), "" if self.weights is None else ", weighted")
+
+    def stacked(self, offset=0):
+        """ (n, 2) int64 array of (i, j) with j shifted by offset"""
+        pairs = np.empty((len(self), 2), dtype=np.int64)
+        pairs[:, 0] = self.left
+        pairs[:, 1] = self.right
+        pairs[:, 1] += offset
+        return pairs
+
+    def toTuples(self, offset=0):
+        """ List of (i, j) tuples with j shifted by offset, the format of the pruning functions"""
+        return list(zip(self.left.tolist(), (self.right.astype(np.int64) + offset).tolist()))
+
+    def take(self, indices):
+        """ Candidates at the given positions (index array or boolean mask)"""
+        return CandidatePairs(self.left[indices], self.right[indices], None if self.weights is None else self.weights[indices])
+
+    def primaryKeys(self, idSpace):
+        """ Primary keys of the entities of each pair as two arrays, from an IdSpace of the entity collections"""
+        return idSpace.ids1[self.left], idSpace.ids2[self.right]
+
+
+def WriteCandidatesNpy(candidates, directory, idSpace=None):
+    """ Writes candidates to directory as left.npy, right.npy and weights.npy (if weighted).
+    With an IdSpace the primary keys of both collections are written too, as ids1.npy and ids2.npy fixed-width string arrays,
+    so that left and right can be mapped back to primary keys without pickled objects."""
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "left.npy"), candidates.left)
+    np.save(os.path.join(directory, "right.npy"), candidates.right)
+    if candidates.weights is not None:
+        np.save(os.path.join(directory, "weights.npy"), candidates.weights)
+    if idSpace is not None:
+        np.save(os.path.join(directory, "ids1.npy"), idSpace.ids1.astype(str))
+        np.save(os.path.join(directory, "ids2.npy"), idSpace.ids2.astype(str))
+
+def ReadCandidatesNpy(directory, mmap_mode='r'):
+    """ Reads candidates written by WriteCandidatesNpy, memory-mapped by default"""
+    weightsPath = os.path.join(directory, "weights.npy")
+    return CandidatePairs(np.load(os.path.join(directory, "left.npy"), mmap_mode=mmap_mode),
+                          np.load(os.path.join(directory, "right.npy"), mmap_mode=mmap_mode),
+                          np.load(weightsPath, mmap_mode=mmap_mode) if os.path.exists(weightsPath) else None)
+
+def _arrowTable(candidates, idSpace):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Writing candidates as Arrow or Parquet requires pyarrow")
+    columns = {"left": pa.array(candidates.left), "right": pa.array(candidates.right)}
+    if idSpace is not None:
+        # primary keys as dictionary columns: the row indices are the dictionary indices, the keys are stored once
+        columns["left_id"] = pa.DictionaryArray.from_arrays(pa.array(candidates.left), pa.array(idSpace.ids1.astype(str)))
+        columns["right_id"] = pa.DictionaryArray.from_arrays(pa.array(candidates.right), pa.array(idSpace.ids2.astype(str)))
+    if candidates.weights is not None:
+        columns["weight"] = pa.array(candidates.weights)
+    return pa.table(columns)
+
+def WriteCandidatesArrow(candidates, path, idSpace=None):
+    """ Writes candidates as a Parquet file if path ends with .parquet, otherwise as an Arrow IPC file that can be memory-mapped.
+    Columns are left, right, left_id and right_id (primary keys, with an IdSpace) and weight (if weighted)."""
+    table = _arrowTable(candidates, idSpace)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        import pyarrow as pa
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
@@ -0,0 +1,83 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from BlockCollection import BlockCollection
+from SparseGraph import IncidenceMatrices
+
+# Quality measures of a block collection or a set of comparisons against a gold standard.
+# pc: pair completeness (found matches / matches in gold standard)
+# pq: pair quality (found matches / distinct comparisons)
+# rr: reduction ratio vs. brute force with all (redundant) comparisons, rrDistinct: the same with redundant comparisons pruned
+# f1: harmonic mean of pc and pq
+# All measures are fractions between 0 and 1.
+EvaluationResult = namedtuple("EvaluationResult", [
+    "pc", "pq", "rr", "rrDistinct", "f1",
+    "matches", "goldStandardSize", "comparisons", "distinctComparisons", "bruteForceComparisons"])
+
+
+def GoldStandardIndices(EntityCollection1, EntityCollection2, goldStandard):
+    """ Maps the primary key pairs of the gold standard to row indices in the entity collections, using hash indexes of the primary key columns.
+    Returns (n, 2) int64 array. Pairs with a key not found in the collections are left out."""
+    index1 = pd.Index(EntityCollection1[:, 0]).get_indexer(goldStandard[:, 0])
+    index2 = pd.Index(EntityCollection2[:, 0]).get_indexer(goldStandard[:, 1])
+    found = (index1 >= 0) & (index2 >= 0)
+    return np.stack((index1[found], index2[found]), axis=1).astype(np.int64)
+
+def _result(matches, goldStandardSize, comparisons, distinctComparisons, size1, size2):
+    bruteForce = size1 * size2
+    pc = matches / goldStandardSize if goldStandardSize else 0.0
+    pq = matches / distinctComparisons if distinctComparisons else 0.0
+    f1 = 2 * pc * pq / (pc + pq) if pc + pq else 0.0
+    return EvaluationResult(pc, pq, 1 - comparisons / bruteForce, 1 - distinctComparisons / bruteForce, f1,
+                            matches, goldStandardSize, comparisons, distinctComparisons, bruteForce)
+
+def _distinctComparisons(B1T, B2, chunk_size):
+    """ Number of nonzeros of B1ᵀ·B2, computed for chunk_size rows of B1ᵀ at a time so that only one part of the product is in memory"""
+    count = 0
+    for start in range(0, B1T.shape[0], chunk_size):
+        count += (B1T[start:start + chunk_size] @ B2).nnz
+    return count
+
+def EvaluateBlocks(EntityCollection1, EntityCollection2, blockCollection, goldStandard, chunk_size=10000):
+    """ Evaluates a block collection without enumerating its comparisons.
+    All comparisons are the sum of |b1| * |b2| over the blocks, distinct comparisons the nonzeros of B1ᵀ·B2 (see SparseGraph.IncidenceMatrices),
+    counted for chunk_size entities of collection 1 at a time,
+    and a gold standard pair is found if the rows of its entities in B1ᵀ and B2ᵀ share a block."""
+    blockCollection = BlockCollection.fromDict(blockCollection)
+    B1, B2 = IncidenceMatrices(blockCollection)
+    size1 = len(EntityCollection1)
+    size2 = len(EntityCollection2)
+    B1T = B1.T.tocsr()
+    B2T = B2.T.tocsr()
+    B1T.resize((max(size1, B1T.shape[0]), B1T.shape[1]))
+    B2T.resize((max(size2, B2T.shape[0]), B2T.shape[1]))
+    comparisons = int(blockCollection.comparisons().sum())
+    distinctComparisons = _distinctComparisons(B1T, B2T.T.tocsr(), chunk_size)
+    gold = GoldStandardIndices(EntityCollection1, EntityCollection2, goldStandard)
+    shared = np.asarray(B1T[gold[:, 0]].multiply(B2T[gold[:, 1]]).sum(axis=1)).ravel()
+    return _result(int(np.count_nonzero(shared)), len(goldStandard), comparisons, distinctComparisons, size1, size2)
+
+def EvaluateComparisons(EntityCollection1, EntityCollection2, comparisons, goldStandard, offset=0, idSpace=None):
+    """ Evaluates a list of (i, j) comparisons, or (n, 2) array of them, e.g. the output of the pruning methods.
+    j is shifted by offset, like entities of collection 2 in the blocking graph. Redundant comparisons are found by sorting, not with a set of tuples.
+    With an IdSpace, j is shifted by its offset and the gold standard is mapped with its cached primary key indexes."""
+    pairs = np.asarray(comparisons, dtype=np.int64).reshape(-1, 2)
+    if idSpace is not None:
+        size1, size2, offset = idSpace.size1, idSpace.size2, idSpace.offset
+        gold = idSpace.goldStandardIds(goldStandard).astype(np.int64)
+    else:
+        size1 = len(EntityCollection1)
+        size2 = len(EntityCollection2)
+        gold = GoldStandardIndices(EntityCollection1, EntityCollection2, goldStandard)
+        gold[:, 1] += offset
+    width = size2 + offset
+    keys = np.unique(pairs[:, 0] * width + pairs[:, 1])
+    goldKeys = gold[:, 0] * width + gold[:, 1]
+    matches = int(np.count_nonzero(np.isin(goldKeys, keys)))
+    return _result(matches, len(goldStandard), len(pairs), len(keys), size1, size2)
+
+def FormatResult(result):
+    """ Human readable summary of an EvaluationResult"""
+    return ("Pair Completeness: {0:.2%}\n Pair Quality: {1:.4%}\n F1: {2:.4f}\n"
+            " Reduction Ratio: {3:.2%}\n Reduction Ratio (with redundant pruned): {4:.2%}\n").format(
+                result.pc, result.pq, result.f1, result.rr, result.rrDistinct)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Entity ids of one resolution job. Entities of collection 1 keep their row index as id, entities of collection 2 are shifted by offset = size of collection 1,
+# so ids of both collections are compact int32 numbers 0 .. size1 + size2 - 1 that do not clash.
+# An IdSpace is created once per job from the two entity collections and passed to GraphBuilder, the pruning and evaluation functions,
+# instead of the process-global maxIndex of MetaBlocking.py, which only grows and is shared by all graphs built in the process.
+
+ID_DTYPE = np.int32
+
+
+class IdSpace:
+    """ Id mapping of two entity collections, given by their primary keys (first column of the entity collections)"""
+
+    def __init__(self, ids1, ids2):
+        self.ids1 = np.asarray(ids1)
+        self.ids2 = np.asarray(ids2)
+        self.size1 = len(self.ids1)
+        self.size2 = len(self.ids2)
+        if self.size1 + self.size2 > np.iinfo(ID_DTYPE).max:
+            raise ValueError("Entity collections are too large for {0} ids".format(np.dtype(ID_DTYPE).name))
+        self._index1 = None
+        self._index2 = None
+        self._goldStandard = None
+        self._goldStandardIds = None
+
+    @classmethod
+    def fromCollections(cls, EntityCollection1, EntityCollection2):
+        return cls(EntityCollection1[:, 0], EntityCollection2[:, 0])
+
+    @classmethod
+    def ofSize(cls, size1, size2):
+        """ Id space of collections without primary keys, row indices are used as keys"""
+        return cls(np.arange(size1), np.arange(size2))
+
+    @property
+    def offset(self):
+        """ Shift of collection 2 ids"""
+        return self.size1
+
+    def __len__(self):
+        return self.size1 + self.size2
+
+    def __repr__(self):
+        return "IdSpace({0} + {1} entities)".format(self.size1, self.size2)
+
+    def globalIds(self, indices, collection):
+        """ Ids of row indices of collection 1 or 2"""
+        indices = np.asarray(indices, dtype=ID_DTYPE)
+        return indices + ID_DTYPE(self.offset) if collection == 2 else indices
+
+    def localIds(self, ids):
+        """ Row indices of ids of collection 2 entities in collection 2"""
+        return np.asarray(ids, dtype=ID_DTYPE) - ID_DTYPE(self.offset)
+
+    def collectionOf(self, ids):
+        """ 1 or 2 for each id"""
+        return np.where(np.asarray(ids) < self.offset, 1, 2)
+
+    def primaryKeys(self, ids):
+        """ Primary keys of the entities with the given ids of either collection"""
+        ids = np.asarray(ids, dtype=np.int64)
+        second = ids >= self.offset
+        keys = np.empty(ids.shape, dtype=np.result_type(self.ids1, self.ids2))
+        keys[~second] = self.ids1[ids[~second]]
+        keys[second] = self.ids2[ids[second] - self.offset]
+        return keys
+
+    def _indexes(self):
+        if self._index1 is None:
+            self._index1 = pd.Index(self.ids1)
+            self._index2 = pd.Index(self.ids2)
+        return self._index1, self._index2
+
+    def goldStandardIds(self, goldStandard):
+        """ Maps the primary key pairs of a gold standard to (n, 2) array of ids, the second column shifted by offset.
+        The hash indexes of the primary keys are built once and reused, and so are the ids of the last gold standard array.
+        Pairs with a key not found in the collections are left out."""
+        if goldStandard is self._goldStandard:
+            return self._goldStandardIds
+        index1, index2 = self._indexes()
+        rows1 = index1.get_indexer(goldStandard[:, 0])
+        rows2 = index2.get_indexer(goldStandard[:, 1])
+        found = (rows1 >= 0) & (rows2 >= 0)
+        ids = np.stack((rows1[found], rows2[found] + self.offset), axis=1).astype(ID_DTYPE)
+        ids.flags.writeable = False
+        self._goldStandard = goldStandard
+        self._goldStandardIds = ids
+        return ids
+
+    def check(self, blockCollection):
+        """ Raises ValueError if a BlockCollection has entities outside this id space"""
+        if blockCollection.size1 > self.size1 or blockCollection.size2 > self.size2:
+            raise ValueError("Block collection does not match the id space: {0} + {1} entities, {2}".format(blockCollection.size1, blockCollection.size2, self))
@@ -0,0 +1,244 @@
+from collections import namedtuple
+from fractions import Fraction
+from itertools import chain
+import numpy as np
+import scipy.sparse as sp
+from Blocking import MultiColumnTokenizer, ColumnTokenizer
+from AttributeClusteringBlocking import _tokenizeColumns, _linkAttributes, JaccardSimilarity
+from SparseGraph import BlockingGraph, GraphStatistics
+from Weighting import WEIGHTING_SCHEMES
+from NodePruning import _nodeMask, _topKSegments, _combine
+from MetaBlocking import _exactSum, _exactMean
+from Candidates import CandidatePairs
+
+# Incremental entity resolution: entities are added in batches to either collection, and only the blocks and edges of the new entities are computed.
+# The state kept between batches is the blocking index of both collections (block key -> entities, like TokenBlocker),
+# the number of blocks of each entity, the number of blocks shared by both collections, and the edges of the blocking graph with their common block counts,
+# weights and pruning state, in arrays that grow with doubling capacity.
+# Adding entities never changes the common block count of an existing edge, because an old block can only gain the new entities;
+# block counts of old entities grow when one of their keys becomes shared by both collections.
+# Only the new edges and the edges of entities whose block count changed are reweighted, unless the scheme depends on a statistic
+# of the whole graph that changed (CBS: largest common block count, ECBS: number of blocks, EJS: number of edges), then all edges are.
+# CNP is recomputed only for the neighborhoods of reweighted edges, WEP compares all weights with the new mean weight.
+# After every batch the pruned edges are exactly those of batch pruning of the whole graph: a batch can add old edges to them and remove others,
+# so each batch returns the pairs that entered and the pairs that left the candidates.
+
+# Statistic of the whole graph each scheme depends on, besides the block counts of the edge's entities
+_GRAPH_STATISTIC = {'CBS': 'maxCommonBlocks', 'ECBS': 'numBlocks', 'EJS': 'numEdges'}
+
+Update = namedtuple("Update", ["pairs", "weights", "retracted"])
+
+
+def _reserve(array, size):
+    """ Returns array if it has room for size items, otherwise a zero padded copy with at least double the capacity"""
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def TokenKeys(transformationFun=MultiColumnTokenizer):
+    """ Key function of token blocking: block keys of an entity are the tokens made by transformationFun"""
+    def keys(rows, collection):
+        return transformationFun(rows)
+    return keys
+
+def AttributeClusterKeys(clusters, transformationFun=ColumnTokenizer):
+    """ Key function of attribute clustering blocking with fixed attribute clusters (see AttributeClusteringBlocking._linkAttributes).
+    Block keys of an entity are the tokens of its columns prefixed by the number of the cluster of the column, like in ClusterBlocker."""
+    def keys(rows, collection):
+        suffix = "_" + str(collection)
+        entityKeys = [[] for _ in range(len(rows))]
+        for i, cluster in enumerate(clusters):
+            for column in cluster:
+                name, _, side = str(column).partition("_")
+                if "_" + side != suffix:
+                    continue
+                for tokens, columnTokens in zip(entityKeys, transformationFun(rows, int(name))):
+                    tokens.extend(str(i) + token for token in columnTokens)
+        return entityKeys
+    return keys
+
+def FitAttributeClusterKeys(EntityCollection1, EntityCollection2, transformationFun=ColumnTokenizer, similarityFun=JaccardSimilarity, column_index=(1,2,3), exhaustive=False):
+    """ Finds the attribute clusters of two entity collections and returns their key function (see AttributeClusterKeys and _linkAttributes for exhaustive)"""
+    tokensEC1 = _tokenizeColumns(EntityCollection1, transformationFun, column_index, "_1")
+    tokensEC2 = _tokenizeColumns(EntityCollection2, transformationFun, column_index, "_2")
+    return AttributeClusterKeys(_linkAttributes(tokensEC1, tokensEC2, similarityFun, exhaustive), transformationFun)
+
+
+class IncrementalResolver:
+    """ Keeps the blocking index and blocking graph of two entity collections and updates them with batches of new entities.
+    keyFunction(rows, collection) returns the block keys of each row of a batch, e.g. TokenKeys() or FitAttributeClusterKeys(...).
+    Edges are weighted with the named scheme (see Weighting.py, all except ARCS which needs the block incidence matrices)
+    and pruned with 'WEP' (weight edge pruning) or 'CNP' (cardinality node pruning with the given ratio and variant)."""
+
+    def __init__(self, keyFunction, scheme='JS', pruning='WEP', ratio=0.1, variant='redefined'):
+        if scheme not in WEIGHTING_SCHEMES or scheme == 'ARCS':
+            raise ValueError("Unsupported weighting scheme: {0}".format(scheme))
+        if pruning not in ('WEP', 'CNP'):
+            raise ValueError("Unsupported pruning method: {0}".format(pruning))
+        self.keyFunction = keyFunction
+        self.scheme = scheme
+        self.pruning = pruning
+        self.ratio = ratio
+        self.variant = variant
+        self.postings = ({}, {})
+        self.ids = ([], [])
+        self.blockCounts = [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)]
+        self.degrees = [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)]
+        self.numBlocks = 0
+        self.numEdges = 0
+        self.maxCommonBlocks = 0
+        # edge arrays, of which the first numEdges items are used
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.cols = np.zeros(0, dtype=np.int32)
+        self.commonBlocks = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0)
+        self.kept = np.zeros(0, dtype=bool)
+        # CNP: edges retained in the neighborhood of their entity of collection 1 and of collection 2
+        self.selected = [np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)]
+        # WEP: exact sum of the weights (see MetaBlocking._exactSum)
+        self.weightSum = Fraction(0)
+
+    @property
+    def sizes(self):
+        return len(self.ids[0]), len(self.ids[1])
+
+    def _addToIndex(self, keys, side, start):
+        """ Adds the keys of new entities to the blocking index of one side.
+        Returns new entity and its co-blocked entities of the other side for every (key, new entity) pair in a shared block,
+        and the entities of the other side whose block count changed."""
+        mine = self.postings[side]
+        other = self.postings[1 - side]
+        blockCounts = self.blockCounts
+        entities = []
+        neighbors = []
+        changed = []
+        for entity, entityKeys in enumerate(keys, start):
+            for key in entityKeys:
+                postings = mine.setdefault(key, [])
+                otherPostings = other.get(key)
+                if otherPostings:
+                    if not postings:
+                        # key is now shared by both collections, so it becomes a block of the old entities too
+                        self.numBlocks += 1
+                        np.add.at(blockCounts[1 - side], otherPostings, 1)
+                        changed.append(otherPostings)
+                    blockCounts[side][entity] += 1
+                    entities.append(np.full(len(otherPostings), entity, dtype=np.int64))
+                    neighbors.append(otherPostings)
+                postings.append(entity)
+        changed = np.fromiter(chain.from_iterable(changed), dtype=np.int64)
+        if not entities:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), changed
+        return np.concatenate(entities), np.fromiter(chain.from_iterable(neighbors), dtype=np.int64), changed
+
+    def _addEdges(self, newRows, newCols, counts):
+        start = self.numEdges
+        stop = start + len(counts)
+        for name in ('rows', 'cols', 'commonBlocks', 'weights', 'kept'):
+            setattr(self, name, _reserve(getattr(self, name), stop))
+        self.selected = [_reserve(selected, stop) for selected in self.selected]
+        self.rows[start:stop] = newRows
+        self.cols[start:stop] = newCols
+        self.commonBlocks[start:stop] = counts
+        for degrees, entities in zip(self.degrees, (newRows, newCols)):
+            nodes, newEdges = np.unique(entities, return_counts=True)
+            degrees[nodes] += newEdges
+        self.numEdges = stop
+        if len(counts):
+            self.maxCommonBlocks = max(self.maxCommonBlocks, int(counts.max()))
+
+    def add(self, rows, collection):
+        """ Adds rows (2d array with primary key in the first column) to collection 1 or 2, and updates weights and pruning.
+        Returns an Update: pairs that entered the pruned comparisons, as (n, 2) array of (entity of collection 1, entity of collection 2) indices,
+        their weights, and retracted pairs that were pruned comparisons before the batch but are not anymore.
+        Entities are numbered in the order they are added to their collection."""
+        if collection not in (1, 2):
+            raise ValueError("Collection must be 1 or 2")
+        side = collection - 1
+        start = len(self.ids[side])
+        self.ids[side].extend(rows[:, 0].tolist())
+        size = len(self.ids[side])
+        self.blockCounts[side] = _reserve(self.blockCounts[side], size)
+        self.degrees[side] = _reserve(self.degrees[side], size)
+        statistic = _GRAPH_STATISTIC.get(self.scheme)
+        before = getattr(self, statistic) if statistic else None
+        oldEdges = self.numEdges
+        entities, neighbors, changed = self._addToIndex(self.keyFunction(rows, collection), side, start)
+
+        # count common blocks of each new edge
+        width = len(self.ids[1 - side])
+        pairs, counts = np.unique(entities * width + neighbors, return_counts=True)
+        newEntities, newNeighbors = np.divmod(pairs, width) if width else (pairs, pairs)
+        newRows, newCols = (newEntities, newNeighbors) if side == 0 else (newNeighbors, newEntities)
+        self._addEdges(newRows, newCols, counts)
+
+        # edges whose weight changed: all if the statistic of the scheme changed, otherwise the new ones and those of entities with new blocks
+        if statistic and getattr(self, statistic) != before:
+            reweighted = np.arange(self.numEdges)
+        else:
+            changedEntities = np.zeros(width, dtype=bool)
+            changedEntities[changed] = True
+            otherEntities = (self.cols if side == 0 else self.rows)[:oldEdges]
+            reweighted = np.concatenate((np.flatnonzero(changedEntities[otherEntities]), np.arange(oldEdges, self.numEdges)))
+        return self._prune(reweighted)
+
+    def _statistics(self):
+        size1, size2 = self.sizes
+        return GraphStatistics(self.numEdges, self.degrees[0][:size1], self.degrees[1][:size2], self.maxCommonBlocks)
+
+    def _subgraph(self, edges):
+        """ BlockingGraph of the given edges (sorted by entity of collection 1 and then of collection 2) with the statistics of the whole graph"""
+        size1, size2 = self.sizes
+        indptr = np.zeros(size1 + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.rows[edges], minlength=size1), out=indptr[1:])
+        matrix = sp.csr_matrix((self.commonBlocks[edges], self.cols[edges], indptr), shape=(size1, size2))
+        return BlockingGraph(matrix, self.blockCounts[0][:size1], self.blockCounts[1][:size2], 0, self.numBlocks, statistics=self._statistics())
+
+    def graph(self):
+        """ Current blocking graph as SparseGraph.BlockingGraph, weighted with the scheme of the resolver"""
+        n = self.numEdges
+        edges = np.lexsort((self.cols[:n], self.rows[:n]))
+        return self._subgraph(edges).withWeights(self.weights[edges])
+
+    def candidates(self):
+        """ Current pruned comparisons as Candidates.CandidatePairs with their weights, the same as pruning the whole graph at once"""
+        kept = np.flatnonzero(self.kept[:self.numEdges])
+        return CandidatePairs(self.rows[kept], self.cols[kept], self.weights[kept])
+
+    def _prune(self, reweighted):
+        """ Reweights the given edges, updates the pruned edges and returns the Update"""
+        n = self.numEdges
+        reweighted = reweighted[np.lexsort((self.cols[reweighted], self.rows[reweighted]))]
+        weights = WEIGHTING_SCHEMES[self.scheme](self._subgraph(reweighted)) if len(reweighted) else np.zeros(0)
+        if self.pruning == 'WEP':
+            if len(reweighted) == n:
+                self.weightSum = _exactSum(weights)
+            else:
+                self.weightSum += _exactSum(weights) - _exactSum(self.weights[reweighted])
+            self.weights[reweighted] = weights
+            updated = np.arange(n)
+            kept = self.weights[:n] >= _exactMean(self.weightSum, n) if n else np.zeros(0, dtype=bool)
+        else:
+            self.weights[reweighted] = weights
+            # neighborhoods of the reweighted edges are pruned again, the edges of all other neighborhoods keep their selection
+            updated = np.zeros(n, dtype=bool)
+            for side, (keys, neighbors) in enumerate(((self.rows, self.cols), (self.cols, self.rows))):
+                touched = np.zeros(self.sizes[side], dtype=bool)
+                touched[keys[reweighted]] = True
+                inNeighborhood = touched[keys[:n]]
+                edges = np.flatnonzero(inNeighborhood)
+                self.selected[side][edges] = _nodeMask(keys[edges], neighbors[edges], self.weights[edges],
+                                                       lambda indptr, w: _topKSegments(indptr, w, self.ratio))
+                updated |= inNeighborhood
+            updated = np.flatnonzero(updated)
+            kept = _combine(self.selected[0][updated], self.selected[1][updated], self.variant)
+        changed = updated[kept != self.kept[updated]]
+        self.kept[updated] = kept
+        entered = changed[self.kept[changed]]
+        retracted = changed[~self.kept[changed]]
+        return Update(self._pairs(entered), self.weights[entered], self._pairs(retracted))
+
+    def _pairs(self, edges):
+        return np.stack((self.rows[edges], self.cols[edges]), axis=1).astype(np.int64)
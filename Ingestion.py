@@ -0,0 +1,64 @@
+import array
+import numpy as np
+import pandas as pd
+from Tokenization import TokenizeStream, DEFAULT_CHUNK_SIZE
+from TokenCache import InvertTokenIds
+from BlockCollection import BlockCollection
+from IdSpace import IdSpace
+
+# Streaming ingestion of entity collections from csv files.
+# The file is read chunk_size rows at a time, and only the primary key column and the columns to be tokenized are parsed.
+# Each chunk is tokenized like MultiColumnTokenizer and its tokens are appended to the blocking index as integer token ids
+# with the global row numbers of the entities, so neither the whole entity collection nor the token lists of all entities are ever in memory.
+# Columns to be tokenized are read as strings, so that the tokens do not depend on the chunk boundaries
+# (pandas infers the dtypes of every chunk separately, a value like "1.50" could be parsed as a number in one chunk and kept as text in another).
+# The result is the same block collection as TokenBlocking(EC1, EC2, MultiColumnTokenizer, TokenBlocker) on the whole files,
+# except for values of columns that pandas parses as numbers when reading the whole file: those are tokenized as written in the file
+# (e.g. "20.00"), not as str of the parsed number ("20.0").
+
+ENCODING = "ISO-8859-1"
+
+
+def ReadCsvChunks(path, column_index=(1,2,3), chunk_size=DEFAULT_CHUNK_SIZE, encoding=ENCODING):
+    """ Reads the primary key (first column) and the columns column_index of a csv file in chunks of chunk_size rows.
+    Yields (primary keys, texts) of each chunk, where the text of a row is its columns joined with " ", like in MultiColumnTokenizer.
+    The columns are read as strings, missing values as nan."""
+    columns = sorted(set((0,) + tuple(column_index)))
+    positions = [columns.index(column) for column in column_index]
+    names = pd.read_csv(path, encoding=encoding, nrows=0).columns
+    dtypes = {names[column]: str for column in column_index}
+    for chunk in pd.read_csv(path, encoding=encoding, usecols=columns, dtype=dtypes, chunksize=chunk_size):
+        values = [chunk.iloc[:, position].tolist() for position in positions]
+        yield chunk.iloc[:, 0].tolist(), [" ".join(map(str, row)) for row in zip(*values)]
+
+def _collectPrimaryKeys(chunks, primaryKeys):
+    """ Yields the texts of the chunks, appending their primary keys to primaryKeys as the chunks are read"""
+    for chunkKeys, texts in chunks:
+        primaryKeys.extend(chunkKeys)
+        yield texts
+
+def StreamingTokenBlocker(path, column_index=(1,2,3), chunk_size=DEFAULT_CHUNK_SIZE, processes=None, encoding=ENCODING):
+    """ Token blocking index of a csv file, built chunk by chunk.
+    Returns (primary keys, tokens, postingOffsets, postings): entities (row numbers) having tokens[t] are postings[postingOffsets[t]:postingOffsets[t+1]],
+    tokens are in order of their first appearance like the keys of TokenBlocker."""
+    vocabulary = {}
+    primaryKeys = []
+    tokenIds = array.array('i')
+    lengths = array.array('q')
+    texts = _collectPrimaryKeys(ReadCsvChunks(path, column_index, chunk_size, encoding), primaryKeys)
+    for tokenArray in TokenizeStream(texts, processes):
+        for tokens in tokenArray:
+            tokenIds.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+            lengths.append(len(tokens))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(np.frombuffer(lengths, dtype=np.int64), out=offsets[1:])
+    postingOffsets, postings = InvertTokenIds(np.frombuffer(tokenIds, dtype=np.int32), offsets, len(vocabulary))
+    return np.array(primaryKeys, dtype=object), list(vocabulary), postingOffsets, postings
+
+def StreamingTokenBlocking(path1, path2, column_index=(1,2,3), chunk_size=DEFAULT_CHUNK_SIZE, processes=None, encoding=ENCODING):
+    """ Token blocking of two csv files without loading them (see StreamingTokenBlocker).
+    Returns (BlockCollection, IdSpace of the primary keys of both files)."""
+    ids1, tokens1, offsets1, postings1 = StreamingTokenBlocker(path1, column_index, chunk_size, processes, encoding)
+    ids2, tokens2, offsets2, postings2 = StreamingTokenBlocker(path2, column_index, chunk_size, processes, encoding)
+    blockCollection = BlockCollection.fromPostings(tokens1, offsets1, postings1, tokens2, offsets2, postings2, len(ids1), len(ids2))
+    return blockCollection, IdSpace(ids1, ids2)
@@ -0,0 +1,212 @@
+import sys
+import time
+import logging
+import tracemalloc
+from functools import wraps
+from contextlib import contextmanager
+import numpy as np
+from BlockCollection import BlockCollection
+
+# Per-stage instrumentation of the pipeline. Instrumented stages (blocking, tokenization, graph building, weighting, pruning)
+# send an event to every registered listener when they finish: a dictionary with the stage name, wall time in seconds,
+# memory peaks of the stage (see StagePeaks) and item counts of the stage's result.
+# Listeners are any callables taking the event, e.g. an EventRecorder, LoggingListener or a function feeding a metrics system.
+# When no listener is registered a stage only costs one extra function call and a check of the listener list.
+
+_listeners = []
+
+
+def AddListener(listener):
+    _listeners.append(listener)
+
+def RemoveListener(listener):
+    _listeners.remove(listener)
+
+@contextmanager
+def Listening(listener):
+    """ Registers listener for the duration of a with block"""
+    AddListener(listener)
+    try:
+        yield listener
+    finally:
+        RemoveListener(listener)
+
+def Enabled():
+    return bool(_listeners)
+
+
+class EventRecorder:
+    """ Listener that keeps the events in a list"""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def stages(self, stage):
+        """ Events of the named stage"""
+        return [event for event in self.events if event["stage"] == stage]
+
+def LoggingListener(logger=None, level=logging.INFO):
+    """ Listener that logs every event as one line of key=value pairs"""
+    logger = logger or logging.getLogger("metablocking")
+    def listener(event):
+        logger.log(level, " ".join("{0}={1}".format(key, value) for key, value in event.items()))
+    return listener
+
+
+def ProcessPeakRss():
+    """ Peak resident set size of the process since it started in bytes, None where the resource module is not available (Windows).
+    This is the peak of the largest stage so far, not of the current one. On Linux resetting the peak of a stage (see StagePeaks)
+    also resets the one reported by getrusage, so the peaks seen before resets are kept in _processPeak."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max(peak if sys.platform == 'darwin' else peak * 1024, _processPeak, _highWaterMark() or 0)
+
+# Memory peaks of single stages. On Linux the peak RSS of the process (VmHWM in /proc/self/status) is reset when a stage starts,
+# by writing 5 to /proc/self/clear_refs, and read when it ends; the peak of traced memory is reset with tracemalloc.reset_peak.
+# A stage that starts inside another one first adds the peaks reached so far to the stages around it, and adds its own peaks to them when it ends.
+_peakStack = []
+_processPeak = 0
+
+def _highWaterMark():
+    """ Peak RSS of the process since the last reset in bytes, None where /proc is not available"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _resetPeaks():
+    """ Resets the peaks, returns whether the peak RSS and the traced peak could be reset.
+    tracemalloc.reset_peak is only available from Python 3.9."""
+    global _processPeak
+    _processPeak = max(_processPeak, _highWaterMark() or 0)
+    tracedResettable = hasattr(tracemalloc, "reset_peak")
+    if tracedResettable and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    try:
+        with open("/proc/self/clear_refs", "w") as clearRefs:
+            clearRefs.write("5")
+        return True, tracedResettable
+    except OSError:
+        return False, tracedResettable
+
+def _currentPeaks():
+    return [_highWaterMark(), tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None]
+
+def _foldPeaks(peaks, other):
+    for i, value in enumerate(other):
+        if value is not None and (peaks[i] is None or value > peaks[i]):
+            peaks[i] = value
+
+@contextmanager
+def StagePeaks():
+    """ Measures the memory peaks of a with block. Yields a dictionary that is filled in when the block ends with
+    peakRss: peak RSS of the process during the block in bytes (None where it can not be reset, e.g. outside Linux),
+    processPeakRss: peak RSS of the process since it started (see ProcessPeakRss) and
+    tracedPeak: peak of the memory traced by tracemalloc during the block, if it is tracing (None before Python 3.9, where it can not be reset)."""
+    if _peakStack:
+        current = _currentPeaks()
+        for outer in _peakStack:
+            _foldPeaks(outer, current)
+    resettable, tracedResettable = _resetPeaks()
+    peaks = [None, None]
+    _peakStack.append(peaks)
+    measured = {}
+    try:
+        yield measured
+    finally:
+        _peakStack.pop()
+        _foldPeaks(peaks, _currentPeaks())
+        for outer in _peakStack:
+            _foldPeaks(outer, peaks)
+        measured["peakRss"] = peaks[0] if resettable else None
+        measured["processPeakRss"] = ProcessPeakRss()
+        if peaks[1] is not None:
+            measured["tracedPeak"] = peaks[1] if tracedResettable else None
+
+# Counters: functions of a stage's result (and its arguments) returning the item counts of the event
+
+def TokenCounts(result, *args):
+    """ Counts of a list of token lists"""
+    return {"entities": len(result), "tokens": sum(map(len, result))}
+
+def BlockHistogram(comparisons):
+    """ Number of blocks with 2^k <= comparisons < 2^(k+1) for k = 0, 1, ..."""
+    comparisons = comparisons[comparisons > 0]
+    if len(comparisons) == 0:
+        return []
+    return np.bincount(np.log2(comparisons).astype(np.int64)).tolist()
+
+def BlockCounts(result, *args):
+    """ Counts of a block collection: blocks, comparisons, largest block and the block size histogram"""
+    comparisons = BlockCollection.fromDict(result).comparisons()
+    return {"blocks": len(comparisons), "comparisons": int(comparisons.sum()),
+            "largestBlock": int(comparisons.max()) if len(comparisons) else 0,
+            "blockSizeHistogram": BlockHistogram(comparisons)}
+
+def KeyCounts(result, *args):
+    """ Counts of a dictionary of block key -> entities, e.g. from TokenBlocker"""
+    return {"blocks": len(result)}
+
+def GraphCounts(result, *args):
+    """ Counts of a dictionary graph or SparseGraph.BlockingGraph"""
+    if hasattr(result, 'numEdges'):
+        return {"nodes": int(np.count_nonzero(result.blockCounts1) + np.count_nonzero(result.blockCounts2)), "edges": result.numEdges}
+    return {"nodes": len(result['nodes']), "edges": len(result['edges'])}
+
+def WeightCounts(result, *args):
+    """ Counts of a weighted dictionary graph, BlockingGraph or an array of edge weights"""
+    if hasattr(result, 'numEdges'):
+        return {"edges": result.numEdges}
+    return {"edges": len(result['edges']) if isinstance(result, dict) else len(result)}
+
+def PruningCounts(result, graph, *args):
+    """ Counts of a pruning stage: edges of the input graph and the remaining edges"""
+    edges = graph.numEdges if hasattr(graph, 'numEdges') else len(graph['edges'])
+    return {"edges": edges, "survivingEdges": len(result)}
+
+
+def _emit(stage, fields, seconds, peaks, counts):
+    event = {"stage": stage}
+    event.update(fields)
+    event["seconds"] = seconds
+    event.update(peaks)
+    event.update(counts)
+    for listener in list(_listeners):
+        listener(event)
+
+def Measure(stage, fun, *args, counter=None, **fields):
+    """ Calls fun(*args) as an instrumented stage and returns its result. fields are added to the event, e.g. the weighting scheme."""
+    if not _listeners:
+        return fun(*args)
+    with StagePeaks() as peaks:
+        start = time.perf_counter()
+        result = fun(*args)
+        seconds = time.perf_counter() - start
+    _emit(stage, fields, seconds, peaks, counter(result, *args) if counter is not None else {})
+    return result
+
+def Instrumented(stage, counter=None, **fields):
+    """ Decorator making every call of a function an instrumented stage (see Measure)"""
+    def decorator(fun):
+        @wraps(fun)
+        def instrumented(*args, **kwargs):
+            if not _listeners:
+                return fun(*args, **kwargs)
+            with StagePeaks() as peaks:
+                start = time.perf_counter()
+                result = fun(*args, **kwargs)
+                seconds = time.perf_counter() - start
+            _emit(stage, fields, seconds, peaks, counter(result, *args) if counter is not None else {})
+            return result
+        return instrumented
+    return decorator
@@ -1,8 +1,14 @@
-import networkx as nx
+import os
+import glob
+from fractions import Fraction
 import numpy as np
-from statistics import mean
-from math import ceil
-import heapq
+from BlockCollection import BlockCollection
+from SparseGraph import BlockingGraph, SparseGraphBuilder, GraphChunks, GraphStatisticsOf
+from Weighting import WEIGHTING_SCHEMES, SCHEMES_WITH_GRAPH_STATISTICS, JaccardWeights, CBSWeights
+from Evaluation import GoldStandardIndices, EvaluateComparisons, FormatResult
+from NodePruning import CardinalityNodePruningMask, WeightedNodePruningMask
+from Candidates import CandidatePairs
+from Instrumentation import Instrumented, GraphCounts, WeightCounts, PruningCounts
 
 # entity1 is from first entity collection, entity2 is from the second.
 # Adds only non-duplicate nodes and edges, keep count of both to help with weighting.
@@ -10,12 +16,35 @@ import heapq
 # Returns dict-in-dict, where 'nodes' consist of entity represented by node (key) and its count (value),
 # and 'edges' consist of tuples (i, j) (key) and its count (value).
 # Adds EC1maxIndex + 1 to EC2 entities, because indices are not unique between ECs.
+# With backend='sparse' the graph is built with sparse matrix products and returned as a SparseGraph.BlockingGraph,
+# which the weighting and pruning functions below accept in place of the dict-in-dict.
+# If an IdSpace (see IdSpace.py) is given, EC2 entities are shifted by its offset instead of maxIndex + 1, and the global maxIndex is not used;
+# the same IdSpace should then be given to the evaluation functions. Without one, offsets of graphs built in the same process can differ.
+# GraphBuilder, the weighting and the pruning functions are instrumented stages, see Instrumentation.py.
 
 maxIndex = 0
-def GraphBuilder(blockCollection):
+def _collection2Offset(blockCollection, idSpace=None):
+    """ Returns the offset for collection 2 entities: the offset of idSpace if given,
+    otherwise maxIndex + 1 after updating maxIndex with the entities of collection 1 in a BlockCollection"""
+    global maxIndex
+    if idSpace is not None:
+        idSpace.check(blockCollection)
+        return idSpace.offset
+    if len(blockCollection.entities1) > 0:
+        maxIndex = max(maxIndex, int(blockCollection.entities1.max()))
+    return maxIndex + 1
+
+@Instrumented("graph", GraphCounts)
+def GraphBuilder(blockCollection, backend='dict', idSpace=None):
+    global maxIndex
+    if backend == 'sparse':
+        blockCollection = BlockCollection.fromDict(blockCollection)
+        return SparseGraphBuilder(blockCollection, _collection2Offset(blockCollection, idSpace))
+    elif backend != 'dict':
+        raise ValueError("Unknown graph backend: {0}".format(backend))
+    offset = idSpace.offset if idSpace is not None else None
     nodes = {}
     edges = {}
-    global maxIndex
     for block in blockCollection:
         # entity1 is from first entity collection, entity2 is from the second
         # Add only non-duplicates, keep count of the nodes and edges
@@ -25,12 +54,14 @@ def GraphBuilder(blockCollection):
                 nodes[entity1] = 1
             else:
                 nodes[entity1] += 1
-            if entity1 > maxIndex:
+            if offset is None and entity1 > maxIndex:
                 maxIndex = entity1
                     
+    if offset is None:
+        offset = maxIndex + 1
     for block in blockCollection:  
         for entity2 in blockCollection[block][1]:
-            entity2 = entity2 + maxIndex + 1
+            entity2 = entity2 + offset
             if entity2 not in nodes:
                 nodes[entity2] = 1
             else:
@@ -46,7 +77,10 @@ def GraphBuilder(blockCollection):
 
 # Adds Jaccard weight info. Edges are tuples (i, j), and work as dictionary keys, their
 # value is the weight of the edge.
+@Instrumented("weighting", WeightCounts, scheme='JS')
 def JaccardWeighting(nodesAndEdges):
+    if isinstance(nodesAndEdges, BlockingGraph):
+        return nodesAndEdges.withWeights(JaccardWeights(nodesAndEdges))
     nodes = nodesAndEdges['nodes']
     edges = nodesAndEdges['edges']
     jaccardWeights = {}
@@ -55,53 +89,156 @@ def JaccardWeighting(nodesAndEdges):
     return {'nodes': nodes, 'edges': jaccardWeights}
 
 # Adds common blocks scheme weight info (normalized). Edges are tuples (i, j), and work as dictionary keys, their
-# value is the weight of the edge.
+# value is the weight of the edge. The input graph is not modified.
+# Other schemes (ARCS, ECBS, EJS) for the sparse graph are in Weighting.py.
+@Instrumented("weighting", WeightCounts, scheme='CBS')
 def CBSWeighting(nodesAndEdges):
+    if isinstance(nodesAndEdges, BlockingGraph):
+        return nodesAndEdges.withWeights(CBSWeights(nodesAndEdges))
     edges = nodesAndEdges['edges']
     max_value = max(edges.values())
     # normalize the values between [0, 1]
+    cbsWeights = {}
     for edge in edges:
-        edges[edge] = edges[edge] / max_value
-    return {'nodes': nodesAndEdges['nodes'], 'edges': edges}
+        cbsWeights[edge] = edges[edge] / max_value
+    return {'nodes': nodesAndEdges['nodes'], 'edges': cbsWeights}
+
+def _exactSum(weights):
+    """ Exact sum of a float array as Fraction. Sums of parts of an array add up to exactly the sum of the whole array,
+    so the mean weight, and the edges it prunes, do not depend on how the edges were split to chunks or processes."""
+    mantissas, exponents = np.frexp(np.asarray(weights, dtype=np.float64))
+    # every float64 is an integer of at most 53 bits times a power of two; split the integers so that their sums fit in int64
+    integers = (mantissas * 2.0**53).astype(np.int64)
+    exponents, inverse = np.unique(exponents, return_inverse=True)
+    high = np.zeros(len(exponents), dtype=np.int64)
+    low = np.zeros(len(exponents), dtype=np.int64)
+    np.add.at(high, inverse, integers >> 26)
+    np.add.at(low, inverse, integers & ((1 << 26) - 1))
+    total = Fraction(0)
+    for exponent, h, l in zip(exponents.tolist(), high.tolist(), low.tolist()):
+        total += Fraction((h << 26) + l) * Fraction(2) ** (exponent - 53)
+    return total
+
+def _exactMean(total, count):
+    """ Correctly rounded mean from an exact sum (see _exactSum)"""
+    return float(total / count)
+
+def _columnarCandidates(nodesAndEdges, mask):
+    """ Edges of a BlockingGraph selected by mask as Candidates.CandidatePairs with their weights"""
+    if not isinstance(nodesAndEdges, BlockingGraph):
+        raise ValueError("Columnar output requires a graph built with backend='sparse'")
+    return CandidatePairs(nodesAndEdges.rows[mask], nodesAndEdges.cols[mask], nodesAndEdges.edgeWeights()[mask])
 
 # Prunes the edges, of which weights are below global average
-def WeightEdgePruning(nodesAndEdges):
+# With columnar=True (sparse graph only) the remaining edges are returned as Candidates.CandidatePairs with their weights instead of a list of tuples.
+@Instrumented("pruning", PruningCounts, pruning='WEP')
+def WeightEdgePruning(nodesAndEdges, columnar=False):
+    if isinstance(nodesAndEdges, BlockingGraph) or columnar:
+        weights = _edgeArrays(nodesAndEdges)[2]
+        mask = weights >= _exactMean(_exactSum(weights), len(weights)) if len(weights) else np.zeros(0, dtype=bool)
+        return _columnarCandidates(nodesAndEdges, mask) if columnar else nodesAndEdges.pairs(mask)
     edges = nodesAndEdges['edges']
-    avgEdgeWeight = mean(edges[k] for k in edges)
-    remainingEdges = {}
-    for edge in edges:
-        if edges[edge] >= avgEdgeWeight:
-            remainingEdges[edge] = edges[edge]
-    return [*remainingEdges]
+    avgEdgeWeight = _exactMean(_exactSum(np.fromiter(edges.values(), dtype=np.float64, count=len(edges))), len(edges))
+    return [edge for edge, weight in edges.items() if weight >= avgEdgeWeight]
+
+# Weight edge pruning for graphs that do not fit in memory. The graph is never built as a whole, instead its edges are computed
+# from the block collection in chunks of chunk_size entities of collection 1 (see SparseGraph.GraphChunks), weighted with the named scheme
+# (see Weighting.py) and dropped again. First pass computes the global mean weight, second pass yields the remaining edges of each chunk
+# as tuple of (pairs, weights), where pairs is a (n, 2) int64 array of (i, j) with j shifted by the collection 2 offset like in the other pruning functions.
+# Schemes that need statistics of the whole graph (CBS, EJS) take one more pass before the first one to collect node degrees.
+# The collection 2 offset is taken from idSpace if given, like in GraphBuilder.
+def StreamingWeightEdgePruning(blockCollection, scheme='JS', chunk_size=10000, idSpace=None):
+    if scheme not in WEIGHTING_SCHEMES:
+        raise ValueError("Unknown weighting scheme: {0}".format(scheme))
+    weightFun = WEIGHTING_SCHEMES[scheme]
+    blockCollection = BlockCollection.fromDict(blockCollection)
+    offset = _collection2Offset(blockCollection, idSpace)
+    statistics = None
+    if scheme in SCHEMES_WITH_GRAPH_STATISTICS:
+        statistics = GraphStatisticsOf(GraphChunks(blockCollection, offset, chunk_size))
+    total = Fraction(0)
+    count = 0
+    for chunk in GraphChunks(blockCollection, offset, chunk_size, statistics):
+        total += _exactSum(weightFun(chunk))
+        count += chunk.numEdges
+    if count == 0:
+        return
+    avgEdgeWeight = _exactMean(total, count)
+    for chunk in GraphChunks(blockCollection, offset, chunk_size, statistics):
+        weights = weightFun(chunk)
+        mask = weights >= avgEdgeWeight
+        pairs = np.empty((np.count_nonzero(mask), 2), dtype=np.int64)
+        pairs[:, 0] = chunk.rows[mask]
+        pairs[:, 1] = chunk.cols[mask] + offset
+        yield pairs, weights[mask]
+
+# Writes chunks of (pairs, weights), e.g. from StreamingWeightEdgePruning, to directory as numbered .npy files. Returns the number of chunks.
+def WriteEdgeChunks(chunks, directory):
+    os.makedirs(directory, exist_ok=True)
+    n = 0
+    for n, (pairs, weights) in enumerate(chunks, 1):
+        np.save(os.path.join(directory, "pairs_{0:06d}.npy".format(n)), pairs)
+        np.save(os.path.join(directory, "weights_{0:06d}.npy".format(n)), weights)
+    return n
+
+# Reads chunks written by WriteEdgeChunks back as memory-mapped (pairs, weights) arrays, in the order they were written.
+def ReadEdgeChunks(directory):
+    for pairsFile in sorted(glob.glob(os.path.join(directory, "pairs_*.npy"))):
+        weightsFile = pairsFile.replace("pairs_", "weights_")
+        yield np.load(pairsFile, mmap_mode='r'), np.load(weightsFile, mmap_mode='r')
+
+def _edgeArrays(nodesAndEdges):
+    """ Edges of a dictionary graph or BlockingGraph as (rows, cols, weights) arrays"""
+    if isinstance(nodesAndEdges, BlockingGraph):
+        return nodesAndEdges.rows, nodesAndEdges.cols, nodesAndEdges.edgeWeights()
+    edges = nodesAndEdges['edges']
+    pairs = np.array(list(edges.keys()), dtype=np.int64).reshape(-1, 2)
+    weights = np.fromiter(edges.values(), dtype=np.float64, count=len(edges))
+    return pairs[:, 0], pairs[:, 1], weights
+
+def _maskedPairs(nodesAndEdges, rows, cols, mask, columnar=False):
+    if columnar:
+        return _columnarCandidates(nodesAndEdges, mask)
+    if isinstance(nodesAndEdges, BlockingGraph):
+        return nodesAndEdges.pairs(mask)
+    return list(zip(rows[mask].tolist(), cols[mask].tolist()))
 
 # From each node's neighborhood, prunes the edges that are below the local top 10 % (k-value) based on their weights.
 # Rounds up, so minimum is always 1. Edges are represented by tuples (i, j); returns the remaining edges in a list of tuples.
-def CardinalityNodePruning(nodesAndEdges):
-    nodes = nodesAndEdges['nodes']
-    edges = nodesAndEdges['edges']
-    remainingEdges = {}
-    graph = nx.Graph()
-    for edge in edges:
-        graph.add_edge(edge[0], edge[1], weight=edges[edge])
-    for node in nodes:
-        stack = []
-        heapq.heapify(stack)
-        neighborhood = graph[node]
-        k = ceil((len(neighborhood) * 0.1))
-        for edge in neighborhood:
-            nodeAndWeight = (edge, neighborhood[edge]['weight'])
-            stack.append(nodeAndWeight)
-        stack.sort(key=lambda tup: tup[1], reverse=True)        
-        while(len(stack)>k):
-            stack.pop()
-
-        for neighbor in stack:
-            remainingEdges[(node, neighbor[0])] = 0
-    return [*remainingEdges]
+# variant='redefined' keeps edges in the top k of either node, 'reciprocal' only edges in the top k of both nodes.
+# Works on edge arrays (see NodePruning.py), neighborhoods of both nodes are selected in CSR order without building a graph.
+# columnar=True returns Candidates.CandidatePairs like in WeightEdgePruning.
+@Instrumented("pruning", PruningCounts, pruning='CNP')
+def CardinalityNodePruning(nodesAndEdges, ratio=0.1, variant='redefined', columnar=False):
+    rows, cols, weights = _edgeArrays(nodesAndEdges)
+    mask = CardinalityNodePruningMask(rows, cols, weights, ratio, variant)
+    return _maskedPairs(nodesAndEdges, rows, cols, mask, columnar)
+
+# From each node's neighborhood, prunes the edges whose weight is below the mean weight of the neighborhood.
+# Variants and return value are the same as in CardinalityNodePruning.
+@Instrumented("pruning", PruningCounts, pruning='WNP')
+def WeightedNodePruning(nodesAndEdges, variant='redefined', columnar=False):
+    rows, cols, weights = _edgeArrays(nodesAndEdges)
+    mask = WeightedNodePruningMask(rows, cols, weights, variant)
+    return _maskedPairs(nodesAndEdges, rows, cols, mask, columnar)
 
 # Makes a new block collection for possible next step
 # Each block is partitioned into two: first part is the entity, and second part is everything still connected to it
-def BlockCollecting(remainingEdges):
+# With an IdSpace the result is a BlockCollection keyed by the entity of collection 1, with the connected entities as row indices of collection 2,
+# so that it can be given to GraphBuilder again. With columnar=True the blocks are returned as Candidates.CandidatePairs grouped by the entity of collection 1.
+# Remaining edges can be given as list of tuples or as CandidatePairs (then without offset, see WeightEdgePruning).
+def BlockCollecting(remainingEdges, idSpace=None, columnar=False):
+    if idSpace is not None or columnar or isinstance(remainingEdges, CandidatePairs):
+        candidates = remainingEdges
+        if not isinstance(candidates, CandidatePairs):
+            candidates = CandidatePairs.fromTuples(remainingEdges, idSpace.offset if idSpace is not None else maxIndex + 1)
+        candidates = candidates.take(np.argsort(candidates.left, kind='stable'))
+        if columnar:
+            return candidates
+        keys, starts = np.unique(candidates.left, return_index=True)
+        offsets2 = np.append(starts, len(candidates)).astype(np.int64)
+        sizes = (idSpace.size1, idSpace.size2) if idSpace is not None else (None, None)
+        return BlockCollection(keys.tolist(), np.arange(len(keys) + 1), keys, offsets2, candidates.right, *sizes)
     blocks = {}
     for edge in remainingEdges:
         if edge[0] not in blocks:
@@ -111,28 +248,25 @@ def BlockCollecting(remainingEdges):
     return blocks
 
 # These two are from Blocking.py, EvaluateMetaBlockCollection has been slightly modified
-def _goldStandardToIndexArray(EntityCollection1, EntityCollection2, goldStandard):
+def _goldStandardToIndexArray(EntityCollection1, EntityCollection2, goldStandard, idSpace=None):
     """Extracts all the required comparisons from the gold standard and maps them to indices in the original entity collections. 
     Returns the comparisons as list of tuples. """
-    s = goldStandard.shape
-    N = s[0]
-    goldStandardIndices = np.ndarray(shape=s, dtype=np.int32)
-    pk1 = EntityCollection1[:, 0]
-    pk2 = EntityCollection2[:, 0]
-    global maxIndex
-    for i in np.arange(N):
-        # Those are supposed to be primary keys so there should ever be only one match
-        # maxIndex + 1 to prevent indices clashing
-        goldStandardIndices[i, 0] =  np.where(pk1 == goldStandard[i, 0])[0]
-        goldStandardIndices[i, 1] =  np.where(pk2 == goldStandard[i, 1])[0] + maxIndex + 1
-    return(list(map(tuple, goldStandardIndices)))
-
-def EvaluateMetaBlockCollection(EntityCollection1, EntityCollection2, comparisons, goldStandard):
-    """Evaluate a block collection against gold standard. Calculates pair completenes, reduction ratio (vs. brute force)  and reduction ratio with redundancy pruning (vs. brute force)"""
-    gsIndexArray = _goldStandardToIndexArray(EntityCollection1, EntityCollection2, goldStandard)
-    unique_comparisons = set(comparisons)
-    matches = [comparison for comparison in gsIndexArray if comparison in unique_comparisons]
-    pc = len(matches)/len(gsIndexArray)*100
-    rr1 = (1 - len(comparisons)/(len(EntityCollection1)*len(EntityCollection2)))*100
-    print("Pair Completeness: {0:.2f}%\n Reduction Ratio: {1:.2f}%\n".format(pc, rr1))
+    if idSpace is not None:
+        return(list(map(tuple, idSpace.goldStandardIds(goldStandard).tolist())))
+    # maxIndex + 1 to prevent indices clashing
+    goldStandardIndices = GoldStandardIndices(EntityCollection1, EntityCollection2, goldStandard)
+    goldStandardIndices[:, 1] += maxIndex + 1
+    return(list(map(tuple, goldStandardIndices.tolist())))
 
+def EvaluateMetaBlockCollection(EntityCollection1, EntityCollection2, comparisons, goldStandard, verbose=True, idSpace=None):
+    """Evaluate a block collection against gold standard. Calculates pair completenes, pair quality and reduction ratio (vs. brute force)
+    Comparisons are given as list of (i, j) tuples or (n, 2) array, see Evaluation.EvaluateComparisons. Returns the measures as EvaluationResult.
+    Collection 2 entities are expected to be shifted by the offset of idSpace if given, otherwise by maxIndex + 1.
+    With an IdSpace the gold standard is mapped to ids only once for repeated evaluations (see IdSpace.goldStandardIds)."""
+    offset = idSpace.offset if idSpace is not None else maxIndex + 1
+    if isinstance(comparisons, CandidatePairs):
+        comparisons = comparisons.stacked(offset)
+    result = EvaluateComparisons(EntityCollection1, EntityCollection2, comparisons, goldStandard, offset, idSpace)
+    if verbose:
+        print(FormatResult(result))
+    return result
@@ -0,0 +1,76 @@
+import numpy as np
+
+# Node-centric pruning of a weighted blocking graph given as edge arrays (rows, cols, weights),
+# where rows are entities of collection 1 and cols entities of collection 2.
+# Every node's neighborhood is a segment of a CSR ordering of the edges, so no graph object is needed.
+# Results are deterministic: each neighborhood is ordered by neighbor id, and ties are broken in that order,
+# so they depend only on the edges and weights, not on the order the graph backend lists them in.
+# Variants: 'redefined' keeps an edge if it is retained in the neighborhood of either of its nodes,
+# 'reciprocal' keeps it only if it is retained in the neighborhoods of both nodes.
+
+VARIANTS = ('redefined', 'reciprocal')
+
+
+def _segments(keys, neighbors):
+    """ Orders edges by node and then by neighbor: returns (order, indptr) so that edges of node n are order[indptr[n]:indptr[n+1]]"""
+    order = np.lexsort((neighbors, keys))
+    indptr = np.zeros(keys.max() + 2 if len(keys) else 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys), out=indptr[1:])
+    return order, indptr
+
+def _topKSegments(indptr, weights, ratio):
+    """ Marks the top k = ceil(ratio * degree) weights of each CSR segment.
+    The k-th largest weight of each segment is found for all segments of equal degree at once, stacked into a matrix, with one partition call per distinct degree.
+    Edges above it are kept, and of the edges equal to it the first ones in segment order (by neighbor id), so the result does not depend on how ties are partitioned."""
+    degrees = np.diff(indptr)
+    k = np.ceil(degrees * ratio).astype(np.int64)
+    nodes = np.repeat(np.arange(len(degrees)), degrees)
+    kth = np.full(len(degrees), -np.inf)
+    partial = np.flatnonzero(k < degrees)
+    for degree in np.unique(degrees[partial]):
+        bucket = partial[degrees[partial] == degree]
+        kd = k[bucket[0]]
+        positions = indptr[bucket][:, None] + np.arange(degree)
+        kth[bucket] = -np.partition(-weights[positions], kd - 1, axis=1)[:, kd - 1]
+    above = weights > kth[nodes]
+    tied = weights == kth[nodes]
+    # rank of each tied edge among the tied edges of its segment
+    tiedBefore = np.cumsum(tied) - tied
+    tiedRank = tiedBefore - tiedBefore[indptr[:-1][nodes]]
+    remaining = k - np.bincount(nodes, weights=above, minlength=len(degrees)).astype(np.int64)
+    return above | (tied & (tiedRank < remaining[nodes]))
+
+def _meanSegments(indptr, weights):
+    """ Marks the weights of each CSR segment that are at least the mean weight of the segment"""
+    degrees = np.diff(indptr)
+    nodes = np.repeat(np.arange(len(degrees)), degrees)
+    sums = np.bincount(nodes, weights=weights, minlength=len(degrees))
+    means = sums[nodes] / degrees[nodes]
+    return weights >= means
+
+def _nodeMask(keys, neighbors, weights, selector):
+    """ Applies a segment selector to the neighborhoods of the nodes given by keys, returns mask in the original edge order"""
+    mask = np.zeros(len(weights), dtype=bool)
+    if len(weights) == 0:
+        return mask
+    order, indptr = _segments(keys, neighbors)
+    mask[order] = selector(indptr, weights[order])
+    return mask
+
+def _combine(mask1, mask2, variant):
+    if variant == 'redefined':
+        return mask1 | mask2
+    elif variant == 'reciprocal':
+        return mask1 & mask2
+    raise ValueError("Unknown node pruning variant: {0}".format(variant))
+
+def CardinalityNodePruningMask(rows, cols, weights, ratio=0.1, variant='redefined'):
+    """ Cardinality node pruning (CNP): each node retains the top ceil(ratio * degree) edges of its neighborhood, at least one.
+    Returns boolean mask of the retained edges."""
+    selector = lambda indptr, w: _topKSegments(indptr, w, ratio)
+    return _combine(_nodeMask(rows, cols, weights, selector), _nodeMask(cols, rows, weights, selector), variant)
+
+def WeightedNodePruningMask(rows, cols, weights, variant='redefined'):
+    """ Weighted node pruning (WNP): each node retains the edges of its neighborhood with weight at least the mean weight of the neighborhood.
+    Returns boolean mask of the retained edges."""
+    return _combine(_nodeMask(rows, cols, weights, _meanSegments), _nodeMask(cols, rows, weights, _meanSegments), variant)
@@ -0,0 +1,204 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from BlockCollection import BlockCollection
+from SparseGraph import IncidenceMatrices, BlockingGraph, GraphStatistics, _commonBlocks
+from Weighting import WEIGHTING_SCHEMES, SCHEMES_WITH_GRAPH_STATISTICS
+from NodePruning import VARIANTS, _nodeMask, _topKSegments, _meanSegments
+from MetaBlocking import _collection2Offset, _exactSum, _exactMean
+
+# Meta-blocking (graph building, weighting and pruning) with a pool of processes.
+# The block-entity incidence matrices are written once to a directory as .npy files (see WriteBlockIndex),
+# and every worker memory-maps them, so the block index is shared by the processes instead of copied to each of them.
+# Entities of collection 1 are split into shards of about equal number of comparisons; a worker builds and weights
+# the edges of one shard (rows of B1ᵀ·B2) and returns only the edges that survive pruning.
+# Node pruning needs the whole neighborhood of the collection 2 entities too, so for CNP and WNP
+# entities of collection 2 are also sharded (columns of B1ᵀ·B2), and the edges kept by both sides are merged by their (i, j) keys.
+# Edge weights of a shard are computed exactly like in the whole graph, schemes that need statistics of the whole graph (CBS, EJS)
+# get them from a first pass over the shards, and the mean weight of WEP is summed exactly (see MetaBlocking._exactSum),
+# so the result is identical to GraphBuilder(blockCollection, 'sparse') followed by Weighting and the pruning function:
+# list of (i, j) tuples in the same order, j shifted by the collection 2 offset.
+# The offset is taken from idSpace (see IdSpace.py) if given, otherwise computed once in the calling process like in GraphBuilder;
+# it is passed to the workers, which never use the global maxIndex.
+
+PRUNING_METHODS = ('WEP', 'CNP', 'WNP')
+
+_INDEX_ARRAYS = ("shape", "b1t_data", "b1t_indices", "b1t_indptr", "b2_data", "b2_indices", "b2_indptr",
+                 "b2c_data", "b2c_indices", "b2c_indptr", "blockCounts1", "blockCounts2")
+
+# Block indexes memory-mapped by this process, by directory
+_indexCache = {}
+
+
+class _BlockIndex:
+    """ Incidence matrices and block counts read from a directory written by WriteBlockIndex"""
+
+    def __init__(self, directory):
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode='r') for name in _INDEX_ARRAYS}
+        numBlocks, size1, size2 = arrays["shape"].tolist()
+        self.numBlocks = numBlocks
+        self.B1T = sp.csr_matrix((arrays["b1t_data"], arrays["b1t_indices"], arrays["b1t_indptr"]), shape=(size1, numBlocks))
+        self.B2 = sp.csr_matrix((arrays["b2_data"], arrays["b2_indices"], arrays["b2_indptr"]), shape=(numBlocks, size2))
+        self.B2C = sp.csc_matrix((arrays["b2c_data"], arrays["b2c_indices"], arrays["b2c_indptr"]), shape=(numBlocks, size2))
+        self.B1 = self.B1T.T
+        self.blockCounts1 = arrays["blockCounts1"]
+        self.blockCounts2 = arrays["blockCounts2"]
+
+def _blockIndex(directory):
+    if directory not in _indexCache:
+        _indexCache[directory] = _BlockIndex(directory)
+    return _indexCache[directory]
+
+def _shardBounds(costs, shards):
+    """ Splits range(len(costs)) into at most shards contiguous (start, stop) ranges of about equal total cost"""
+    if len(costs) == 0:
+        return []
+    cumulative = np.cumsum(costs)
+    bounds = np.searchsorted(cumulative, cumulative[-1] * np.arange(1, shards) / shards, side='right')
+    bounds = np.unique(np.concatenate(([0], bounds, [len(costs)])))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+def WriteBlockIndex(blockCollection, directory):
+    """ Writes the incidence matrices of a block collection (B1ᵀ as CSR, B2 as CSR and CSC) and the block counts of the entities
+    to directory as .npy files that the workers memory-map.
+    Returns the number of comparisons of each entity of collection 1 and of collection 2, used to balance the shards."""
+    os.makedirs(directory, exist_ok=True)
+    B1, B2 = IncidenceMatrices(blockCollection)
+    B1T = B1.T.tocsr()
+    B2C = B2.tocsc()
+    arrays = {
+        "shape": np.array([B1.shape[0], B1.shape[1], B2.shape[1]], dtype=np.int64),
+        "b1t_data": B1T.data, "b1t_indices": B1T.indices, "b1t_indptr": B1T.indptr,
+        "b2_data": B2.data, "b2_indices": B2.indices, "b2_indptr": B2.indptr,
+        "b2c_data": B2C.data, "b2c_indices": B2C.indices, "b2c_indptr": B2C.indptr,
+        "blockCounts1": np.asarray(B1.sum(axis=0)).ravel(),
+        "blockCounts2": np.asarray(B2.sum(axis=0)).ravel()}
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + ".npy"), array)
+    blockSizes1 = np.asarray(B1.sum(axis=1)).ravel()
+    blockSizes2 = np.asarray(B2.sum(axis=1)).ravel()
+    return B1T @ blockSizes2, B2C.T @ blockSizes1
+
+def _rowGraph(index, start, stop, offset, statistics):
+    """ Edges of entities start..stop of collection 1, with all their neighbors"""
+    edges = _commonBlocks(index.B1T[start:stop], index.B2)
+    return BlockingGraph(edges, index.blockCounts1, index.blockCounts2, offset, index.numBlocks,
+                         incidence1=index.B1, incidence2=index.B2, rowOffset=start, statistics=statistics, incidence1T=index.B1T)
+
+def _colGraph(index, start, stop, offset, statistics):
+    """ Edges of entities start..stop of collection 2, with all their neighbors"""
+    edges = _commonBlocks(index.B1T, index.B2C[:, start:stop])
+    return BlockingGraph(edges, index.blockCounts1, index.blockCounts2, offset, index.numBlocks,
+                         incidence1=index.B1, incidence2=index.B2C, statistics=statistics, colOffset=start, incidence1T=index.B1T)
+
+def _selector(pruning, ratio):
+    if pruning == 'CNP':
+        return lambda indptr, weights: _topKSegments(indptr, weights, ratio)
+    return _meanSegments
+
+# Tasks run by the worker processes, each on one shard
+
+def _statisticsTask(directory, start, stop, offset):
+    graph = _rowGraph(_blockIndex(directory), start, stop, offset, None)
+    return graph.numEdges, graph.degrees1()[start:stop], graph.degrees2(), graph.maxCommonBlocks()
+
+def _weightSumTask(directory, scheme, start, stop, offset, statistics):
+    graph = _rowGraph(_blockIndex(directory), start, stop, offset, statistics)
+    return _exactSum(WEIGHTING_SCHEMES[scheme](graph)), graph.numEdges
+
+def _edgePruningTask(directory, scheme, start, stop, offset, statistics, threshold):
+    graph = _rowGraph(_blockIndex(directory), start, stop, offset, statistics)
+    mask = WEIGHTING_SCHEMES[scheme](graph) >= threshold
+    return graph.rows[mask], graph.cols[mask]
+
+def _rowPruningTask(directory, scheme, pruning, ratio, start, stop, offset, statistics):
+    """ Keys (i * size of collection 2 + j) of the edges retained in the neighborhoods of entities start..stop of collection 1"""
+    graph = _rowGraph(_blockIndex(directory), start, stop, offset, statistics)
+    rows = graph.rows.astype(np.int64)
+    mask = _nodeMask(rows - start, graph.cols, WEIGHTING_SCHEMES[scheme](graph), _selector(pruning, ratio))
+    return rows[mask] * len(graph.blockCounts2) + graph.cols[mask]
+
+def _colPruningTask(directory, scheme, pruning, ratio, start, stop, offset, statistics):
+    """ Keys of the edges retained in the neighborhoods of entities start..stop of collection 2"""
+    graph = _colGraph(_blockIndex(directory), start, stop, offset, statistics)
+    mask = _nodeMask(graph.edges.indices, graph.rows, WEIGHTING_SCHEMES[scheme](graph), _selector(pruning, ratio))
+    return graph.rows[mask].astype(np.int64) * len(graph.blockCounts2) + graph.cols[mask]
+
+def _run(executor, fun, argumentLists):
+    """ Runs fun on every list of arguments, in the pool if there is one, and returns the results in order"""
+    if executor is None:
+        return [fun(*arguments) for arguments in argumentLists]
+    return list(executor.map(fun, *zip(*argumentLists))) if argumentLists else []
+
+def _statistics(executor, directory, rowShards, offset, size1, size2):
+    degrees1 = np.zeros(size1, dtype=np.int64)
+    degrees2 = np.zeros(size2, dtype=np.int64)
+    numEdges = 0
+    maxCommonBlocks = 0
+    for (start, stop), (edges, shardDegrees1, shardDegrees2, shardMax) in zip(
+            rowShards, _run(executor, _statisticsTask, [(directory, start, stop, offset) for start, stop in rowShards])):
+        numEdges += edges
+        degrees1[start:stop] = shardDegrees1
+        degrees2 += shardDegrees2
+        maxCommonBlocks = max(maxCommonBlocks, shardMax)
+    return GraphStatistics(numEdges, degrees1, degrees2, maxCommonBlocks)
+
+def _pairs(rows, cols, offset):
+    return list(zip(rows.tolist(), (cols.astype(np.int64) + offset).tolist()))
+
+def ParallelMetaBlocking(blockCollection, scheme='JS', pruning='WEP', ratio=0.1, variant='redefined', processes=None, shards=None, directory=None, idSpace=None):
+    """ Builds, weights (scheme, see Weighting.py) and prunes (pruning is 'WEP', 'CNP' with ratio or 'WNP', node pruning with variant)
+    the blocking graph of a block collection with processes worker processes, default number of CPUs.
+    Each collection is split into shards, default 4 per process. The block index is written to directory, default a temporary directory that is removed afterwards.
+    Returns the remaining edges as list of (i, j) tuples, the same as the single-process pruning functions of MetaBlocking.py."""
+    if scheme not in WEIGHTING_SCHEMES:
+        raise ValueError("Unknown weighting scheme: {0}".format(scheme))
+    if pruning not in PRUNING_METHODS:
+        raise ValueError("Unknown pruning method: {0}".format(pruning))
+    if pruning != 'WEP' and variant not in VARIANTS:
+        raise ValueError("Unknown node pruning variant: {0}".format(variant))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if shards is None:
+        shards = 4 * processes
+    blockCollection = BlockCollection.fromDict(blockCollection)
+    offset = _collection2Offset(blockCollection, idSpace)
+    size1, size2 = blockCollection.size1, blockCollection.size2
+    temporary = directory is None
+    if temporary:
+        directory = tempfile.mkdtemp(prefix="metablocking_")
+    directory = os.path.abspath(directory)
+    executor = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    try:
+        rowCosts, colCosts = WriteBlockIndex(blockCollection, directory)
+        rowShards = _shardBounds(rowCosts, shards)
+        statistics = None
+        if scheme in SCHEMES_WITH_GRAPH_STATISTICS:
+            statistics = _statistics(executor, directory, rowShards, offset, size1, size2)
+
+        if pruning == 'WEP':
+            sums = _run(executor, _weightSumTask, [(directory, scheme, start, stop, offset, statistics) for start, stop in rowShards])
+            count = sum(shardCount for _, shardCount in sums)
+            if count == 0:
+                return []
+            threshold = _exactMean(sum(shardSum for shardSum, _ in sums), count)
+            kept = _run(executor, _edgePruningTask, [(directory, scheme, start, stop, offset, statistics, threshold) for start, stop in rowShards])
+            return _pairs(np.concatenate([rows for rows, _ in kept]), np.concatenate([cols for _, cols in kept]), offset)
+
+        rowKeys = _run(executor, _rowPruningTask, [(directory, scheme, pruning, ratio, start, stop, offset, statistics) for start, stop in rowShards])
+        colKeys = _run(executor, _colPruningTask, [(directory, scheme, pruning, ratio, start, stop, offset, statistics)
+                                                   for start, stop in _shardBounds(colCosts, shards)])
+        rowKeys = np.concatenate(rowKeys) if rowKeys else np.zeros(0, dtype=np.int64)
+        colKeys = np.concatenate(colKeys) if colKeys else np.zeros(0, dtype=np.int64)
+        keys = np.union1d(rowKeys, colKeys) if variant == 'redefined' else np.intersect1d(rowKeys, colKeys)
+        rows, cols = np.divmod(keys, size2) if size2 else (keys, keys)
+        return _pairs(rows, cols, offset)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        _indexCache.pop(directory, None)
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
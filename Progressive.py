@@ -0,0 +1,81 @@
+import heapq
+from itertools import islice
+import numpy as np
+from MetaBlocking import _edgeArrays
+
+# Progressive (pay-as-you-go) scheduling of the comparisons of a weighted blocking graph, e.g. from JaccardWeighting or CBSWeighting.
+# Comparisons are yielded lazily in globally non-increasing weight order, so that matching can be stopped at any budget
+# and the comparisons done so far are the highest weighted ones. The edges are never sorted as a whole:
+# every entity of collection 1 is a node with its edges (a CSR segment), a global heap holds the best remaining edge of each node,
+# and a node's edges are sorted only when the node first reaches the top of the heap.
+# Equal weights are ordered by entity of collection 1, then by entity of collection 2 in the order of the graph's edges.
+
+
+class ProgressiveComparisons:
+    """ Iterator over the edges of a weighted dictionary graph or SparseGraph.BlockingGraph, yielding (i, j, weight) in non-increasing weight order,
+    j shifted by the collection 2 offset like in the pruning functions.
+    If goldStandard is given as (i, j) pairs in the same id space (see MetaBlocking._goldStandardToIndexArray or IdSpace.goldStandardIds),
+    the number of matches found and the pair completeness reached so far are kept in matches and pc."""
+
+    def __init__(self, nodesAndEdges, goldStandard=None):
+        rows, cols, weights = _edgeArrays(nodesAndEdges)
+        order = np.argsort(rows, kind='stable')
+        self._cols = (cols[order].astype(np.int64) + getattr(nodesAndEdges, 'offset', 0))
+        self._weights = np.asarray(weights, dtype=np.float64)[order]
+        rows = rows[order]
+        self._nodes, starts = np.unique(rows, return_index=True)
+        self._indptr = np.append(starts, len(rows))
+        maxWeights = np.maximum.reduceat(self._weights, starts) if len(rows) else np.zeros(0)
+        # heap entries are (-weight, node, position in the sorted neighborhood), position -1 until the neighborhood is sorted
+        self._heap = list(zip((-maxWeights).tolist(), range(len(starts)), [-1] * len(starts)))
+        heapq.heapify(self._heap)
+        self._neighborhoods = {}
+        self._gold = None if goldStandard is None else set(map(tuple, np.asarray(goldStandard, dtype=np.int64).reshape(-1, 2).tolist()))
+        self.comparisons = 0
+        self.matches = 0
+
+    def __iter__(self):
+        return self
+
+    def _sortNeighborhood(self, node):
+        start, stop = self._indptr[node], self._indptr[node + 1]
+        order = np.argsort(-self._weights[start:stop], kind='stable') + start
+        neighborhood = (self._cols[order].tolist(), self._weights[order].tolist())
+        self._neighborhoods[node] = neighborhood
+        return neighborhood
+
+    def __next__(self):
+        heap = self._heap
+        if not heap:
+            raise StopIteration
+        negWeight, node, position = heap[0]
+        if position < 0:
+            position = 0
+            cols, weights = self._sortNeighborhood(node)
+        else:
+            cols, weights = self._neighborhoods[node]
+        comparison = (int(self._nodes[node]), cols[position], weights[position])
+        if position + 1 < len(cols):
+            heapq.heapreplace(heap, (-weights[position + 1], node, position + 1))
+        else:
+            heapq.heappop(heap)
+            del self._neighborhoods[node]
+        self.comparisons += 1
+        if self._gold is not None and comparison[:2] in self._gold:
+            self.matches += 1
+        return comparison
+
+    @property
+    def pc(self):
+        """ Pair completeness of the comparisons yielded so far, None without gold standard"""
+        if self._gold is None:
+            return None
+        return self.matches / len(self._gold) if self._gold else 0.0
+
+    def remaining(self):
+        """ Number of comparisons not yet yielded"""
+        return len(self._weights) - self.comparisons
+
+    def take(self, budget):
+        """ Next budget comparisons (fewer if the graph runs out) as list of (i, j, weight)"""
+        return list(islice(self, budget))
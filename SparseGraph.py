@@ -0,0 +1,172 @@
+from collections import namedtuple
+import numpy as np
+import scipy.sparse as sp
+from BlockCollection import BlockCollection
+
+# Statistics of a whole blocking graph, given to graphs that hold only a chunk of its edges
+GraphStatistics = namedtuple("GraphStatistics", ["numEdges", "degrees1", "degrees2", "maxCommonBlocks"])
+
+
+def IncidenceMatrices(blockCollection):
+    """ Builds the block-entity incidence matrices of both entity collections from a block collection.
+    Returns (B1, B2) as scipy.sparse CSR matrices of shape (number of blocks, size of collection), where B[b, i] is the number of times entity i is in block b.
+    The posting arrays are copied, because summing duplicates reorders the matrix in place."""
+    bc = BlockCollection.fromDict(blockCollection)
+    numBlocks = len(bc)
+    B1 = sp.csr_matrix((np.ones(len(bc.entities1), dtype=np.int32), bc.entities1, bc.offsets1), shape=(numBlocks, bc.size1), copy=True)
+    B2 = sp.csr_matrix((np.ones(len(bc.entities2), dtype=np.int32), bc.entities2, bc.offsets2), shape=(numBlocks, bc.size2), copy=True)
+    B1.sum_duplicates()
+    B2.sum_duplicates()
+    return B1, B2
+
+
+class BlockingGraph:
+    """ Blocking graph in sparse form. Edges are the nonzeros of a CSR matrix of shape (size of collection 1, size of collection 2),
+    value of an edge (i, j) is the number of blocks shared by entity i of collection 1 and entity j of collection 2.
+    blockCounts1 and blockCounts2 are the number of blocks of each entity, that is the node counts of the dictionary graph.
+    weights is None for an unweighted graph, otherwise an array of edge weights in the order of the CSR nonzeros.
+    Entities of collection 2 are shifted by offset when edges are given as (i, j) tuples, like in the dictionary graph.
+    incidence1 and incidence2 are the block-entity incidence matrices the graph was built from, used by weighting schemes that depend on block sizes,
+    incidence1T is the transpose of incidence1 as CSR, computed once when first needed and shared by the chunks of a graph.
+    A graph can also hold only the edges of entities rowOffset.. rowOffset + edges.shape[0] of collection 1 (see GraphChunks),
+    or of entities colOffset.. colOffset + edges.shape[1] of collection 2,
+    then statistics of the whole graph are given as GraphStatistics so that edge weights are the same as in the whole graph."""
+
+    def __init__(self, edges, blockCounts1, blockCounts2, offset, numBlocks, weights=None, incidence1=None, incidence2=None, rowOffset=0, statistics=None, colOffset=0, incidence1T=None):
+        self.edges = edges
+        self.blockCounts1 = blockCounts1
+        self.blockCounts2 = blockCounts2
+        self.offset = offset
+        self.numBlocks = numBlocks
+        self.weights = weights
+        self.incidence1 = incidence1
+        self.incidence2 = incidence2
+        self.rowOffset = rowOffset
+        self.colOffset = colOffset
+        self.statistics = statistics
+        self.incidence1T = incidence1T
+
+    @property
+    def rows(self):
+        """ Entity of collection 1 of each edge"""
+        return np.repeat(np.arange(self.rowOffset, self.rowOffset + self.edges.shape[0], dtype=np.int32), np.diff(self.edges.indptr))
+
+    @property
+    def cols(self):
+        """ Entity of collection 2 of each edge"""
+        if self.colOffset:
+            return self.edges.indices + np.int32(self.colOffset)
+        return self.edges.indices
+
+    @property
+    def commonBlocks(self):
+        """ Number of common blocks of each edge"""
+        return self.edges.data
+
+    @property
+    def numEdges(self):
+        return self.edges.nnz
+
+    def transposedIncidence1(self):
+        """ Transpose of incidence1 as CSR matrix (entities of collection 1 x blocks), of the whole graph also for a chunk"""
+        if self.incidence1T is None:
+            self.incidence1T = self.incidence1.T.tocsr()
+        return self.incidence1T
+
+    def totalEdges(self):
+        """ Number of edges in the whole graph"""
+        return self.numEdges if self.statistics is None else self.statistics.numEdges
+
+    def maxCommonBlocks(self):
+        """ Largest number of common blocks of an edge in the whole graph"""
+        if self.statistics is not None:
+            return self.statistics.maxCommonBlocks
+        return self.commonBlocks.max() if self.numEdges else 0
+
+    def degrees1(self):
+        """ Number of edges of each entity of collection 1"""
+        if self.statistics is not None:
+            return self.statistics.degrees1
+        degrees = np.zeros(len(self.blockCounts1), dtype=np.int64)
+        degrees[self.rowOffset:self.rowOffset + self.edges.shape[0]] = np.diff(self.edges.indptr)
+        return degrees
+
+    def degrees2(self):
+        """ Number of edges of each entity of collection 2"""
+        if self.statistics is not None:
+            return self.statistics.degrees2
+        degrees = np.zeros(len(self.blockCounts2), dtype=np.int64)
+        degrees[self.colOffset:self.colOffset + self.edges.shape[1]] = np.bincount(self.edges.indices, minlength=self.edges.shape[1])
+        return degrees
+
+    def edgeWeights(self):
+        """ Edge weights, or number of common blocks if the graph is not weighted"""
+        return self.commonBlocks if self.weights is None else self.weights
+
+    def withWeights(self, weights):
+        """ Returns a graph sharing the topology of this graph with the given edge weights"""
+        if len(weights) != self.numEdges:
+            raise ValueError("Number of weights does not match number of edges")
+        return BlockingGraph(self.edges, self.blockCounts1, self.blockCounts2, self.offset, self.numBlocks, weights,
+                             self.incidence1, self.incidence2, self.rowOffset, self.statistics, self.colOffset, self.incidence1T)
+
+    def pairs(self, mask=None):
+        """ Returns the edges (optionally only those selected by a boolean mask) as list of (i, j) tuples, j shifted by offset"""
+        rows = self.rows
+        cols = self.cols.astype(np.int64) + self.offset
+        if mask is not None:
+            rows = rows[mask]
+            cols = cols[mask]
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    def toDict(self):
+        """ Converts to the dictionary graph made by the dict backend of GraphBuilder"""
+        nodes = {i: c for i, c in enumerate(self.blockCounts1.tolist()) if c > 0}
+        nodes.update({j + self.offset: c for j, c in enumerate(self.blockCounts2.tolist()) if c > 0})
+        edges = dict(zip(self.pairs(), self.edgeWeights().tolist()))
+        return {'nodes': nodes, 'edges': edges}
+
+
+def _commonBlocks(B1T, B2):
+    """ Common block counts of entities of collection 1 (rows of B1ᵀ) and collection 2, as canonical CSR matrix"""
+    edges = (B1T @ B2).tocsr()
+    edges.sum_duplicates()
+    edges.sort_indices()
+    return edges
+
+def SparseGraphBuilder(blockCollection, offset):
+    """ Builds the blocking graph as sparse matrix: with block-entity incidence matrices B1 and B2 the common block counts are B1ᵀ·B2
+    and block counts of the entities are the column sums of B1 and B2."""
+    B1, B2 = IncidenceMatrices(blockCollection)
+    B1T = B1.T.tocsr()
+    edges = _commonBlocks(B1T, B2)
+    blockCounts1 = np.asarray(B1.sum(axis=0)).ravel()
+    blockCounts2 = np.asarray(B2.sum(axis=0)).ravel()
+    return BlockingGraph(edges, blockCounts1, blockCounts2, offset, B1.shape[0], incidence1=B1, incidence2=B2, incidence1T=B1T)
+
+def GraphChunks(blockCollection, offset, chunk_size=10000, statistics=None):
+    """ Yields the blocking graph in chunks of chunk_size entities of collection 1, each chunk as a BlockingGraph with the edges of those entities.
+    Only one chunk of edges is in memory at a time. Statistics of the whole graph (see GraphStatisticsOf) are attached to the chunks if given."""
+    B1, B2 = IncidenceMatrices(blockCollection)
+    B1T = B1.T.tocsr()
+    blockCounts1 = np.asarray(B1.sum(axis=0)).ravel()
+    blockCounts2 = np.asarray(B2.sum(axis=0)).ravel()
+    for start in range(0, B1T.shape[0], chunk_size):
+        edges = _commonBlocks(B1T[start:start + chunk_size], B2)
+        yield BlockingGraph(edges, blockCounts1, blockCounts2, offset, B1.shape[0], incidence1=B1, incidence2=B2, rowOffset=start, statistics=statistics, incidence1T=B1T)
+
+def GraphStatisticsOf(chunks):
+    """ Computes GraphStatistics of a whole graph from its chunks (see GraphChunks), keeping only per-node counts in memory"""
+    numEdges = 0
+    degrees1 = None
+    degrees2 = None
+    maxCommonBlocks = 0
+    for chunk in chunks:
+        if degrees1 is None:
+            degrees1 = np.zeros(len(chunk.blockCounts1), dtype=np.int64)
+            degrees2 = np.zeros(len(chunk.blockCounts2), dtype=np.int64)
+        numEdges += chunk.numEdges
+        degrees1 += chunk.degrees1()
+        degrees2 += chunk.degrees2()
+        maxCommonBlocks = max(maxCommonBlocks, chunk.maxCommonBlocks())
+    return GraphStatistics(numEdges, degrees1, degrees2, maxCommonBlocks)
@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from Tokenization import TOKENIZER_SETTINGS
+from BlockCollection import BlockCollection
+
+CACHE_FORMAT_VERSION = 2
+
+
+def EncodeTokenLists(tokenArray):
+    """ Interns tokens of a list of token lists to integer ids.
+    Returns (vocabulary, token ids, offsets) where vocabulary is a list of the tokens in order of first appearance
+    and tokens of entity i are vocabulary[t] for t in tokenIds[offsets[i]:offsets[i+1]]."""
+    ids = {}
+    tokenIds = np.fromiter((ids.setdefault(token, len(ids)) for tokens in tokenArray for token in tokens), dtype=np.int32)
+    offsets = np.zeros(len(tokenArray) + 1, dtype=np.int64)
+    np.cumsum([len(tokens) for tokens in tokenArray], out=offsets[1:])
+    return list(ids), tokenIds, offsets
+
+def EncodeVocabulary(vocabulary):
+    """ Stores a list of strings compactly as (UTF-8 bytes of all strings concatenated as uint8 array, int64 offsets),
+    instead of a fixed-width unicode array that takes 4 bytes times the longest string for every string."""
+    encoded = [token.encode("utf-8") for token in vocabulary]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(token) for token in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def DecodeVocabulary(data, offsets):
+    """ Inverse of EncodeVocabulary, returns list of strings"""
+    raw = np.asarray(data).tobytes()
+    offsets = np.asarray(offsets).tolist()
+    return [raw[start:stop].decode("utf-8") for start, stop in zip(offsets[:-1], offsets[1:])]
+
+def DecodeTokenLists(vocabulary, tokenIds, offsets):
+    """ Inverse of EncodeTokenLists, returns list of token lists"""
+    vocabulary = list(vocabulary)
+    tokenIds = tokenIds.tolist()
+    return [[vocabulary[t] for t in tokenIds[offsets[i]:offsets[i+1]]] for i in range(len(offsets) - 1)]
+
+def InvertTokenIds(tokenIds, offsets, numTokens):
+    """ Builds the token blocking index from encoded token lists.
+    Returns (postingOffsets, postings) where entities having token t are postings[postingOffsets[t]:postingOffsets[t+1]], in ascending order."""
+    entities = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+    order = np.argsort(tokenIds, kind='stable')
+    postings = entities[order]
+    postingOffsets = np.zeros(numTokens + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tokenIds, minlength=numTokens), out=postingOffsets[1:])
+    return postingOffsets, postings
+
+def FileFingerprint(path, chunk_size=2**20):
+    """ Hash of the contents of a file"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def ArrayFingerprint(EC):
+    """ Hash of the contents of an entity collection (2d array), computed row-wise with pandas' vectorized hashing"""
+    digest = hashlib.sha1()
+    digest.update(str(EC.shape).encode())
+    digest.update(pd.util.hash_pandas_object(pd.DataFrame(EC), index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def _tokenizerName(transformationFun):
+    """ Module and qualified name of a module level function or class, the default identity of a tokenizer in cache keys.
+    Lambdas, nested functions and callables without a qualified name (e.g. functools.partial) would share or lack a name, so they are refused."""
+    qualname = getattr(transformationFun, "__qualname__", None)
+    if qualname is None or "<" in qualname:
+        raise ValueError("Tokenizer {0!r} has no stable qualified name, give a tokenizerName for the cache".format(transformationFun))
+    return transformationFun.__module__ + "." + qualname
+
+
+class TokenCache:
+    """ Persistent on-disk cache for tokenized columns and token blocking indexes.
+    Each entry is a directory of .npy arrays (token vocabulary as UTF-8 bytes and offsets, token ids and CSR offsets of the tokens of each entity and of the entities of each token),
+    which are loaded memory-mapped. Entries are keyed by a hash of the dataset fingerprint, the column selection and the tokenizer settings."""
+
+    def __init__(self, directory="token_cache"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, fingerprint, transformationFun, column_index, tokenizerName=None):
+        """ Cache key of tokens made by transformationFun from column(s) column_index of a dataset with the given fingerprint.
+        The tokenizer is identified by tokenizerName if given, otherwise by the qualified name of transformationFun (see _tokenizerName)."""
+        description = {
+            "version": CACHE_FORMAT_VERSION,
+            "dataset": fingerprint,
+            "columns": column_index if column_index is None or np.isscalar(column_index) else list(column_index),
+            "tokenizer": tokenizerName if tokenizerName is not None else _tokenizerName(transformationFun),
+            "settings": TOKENIZER_SETTINGS}
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load(self, key):
+        path = self._path(key)
+        if not os.path.isdir(path):
+            return None
+        entry = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r') for name in os.listdir(path) if name.endswith(".npy")}
+        entry["vocabulary"] = DecodeVocabulary(entry.pop("vocabulary_bytes"), entry.pop("vocabulary_offsets"))
+        return entry
+
+    def _store(self, key, arrays):
+        """ Writes the arrays to a temporary directory first and moves it in place, so that readers never see partial entries"""
+        tmp = tempfile.mkdtemp(dir=self.directory)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), array)
+        try:
+            os.rename(tmp, self._path(key))
+        except OSError:
+            # Entry was written by someone else in the meantime
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def encodedTokens(self, EC, transformationFun, column_index=None, fingerprint=None, tokenizerName=None):
+        """ Returns the encoded tokens (see EncodeTokenLists) and the token blocking index (see InvertTokenIds) of an entity collection
+        as dictionary of arrays, tokenizing the collection only if it is not cached yet.
+        Fingerprint of the dataset (e.g. FileFingerprint of its csv file) is computed from the array if not given."""
+        if fingerprint is None:
+            fingerprint = ArrayFingerprint(EC)
+        key = self.key(fingerprint, transformationFun, column_index, tokenizerName)
+        entry = self._load(key)
+        if entry is None:
+            tokens = transformationFun(EC) if column_index is None else transformationFun(EC, column_index)
+            vocabulary, tokenIds, offsets = EncodeTokenLists(tokens)
+            postingOffsets, postings = InvertTokenIds(tokenIds, offsets, len(vocabulary))
+            vocabularyBytes, vocabularyOffsets = EncodeVocabulary(vocabulary)
+            self._store(key, {"vocabulary_bytes": vocabularyBytes, "vocabulary_offsets": vocabularyOffsets, "token_ids": tokenIds, "offsets": offsets,
+                              "posting_offsets": postingOffsets, "postings": postings})
+            entry = self._load(key)
+        return entry
+
+    def tokenize(self, EC, transformationFun, column_index=None, fingerprint=None, tokenizerName=None):
+        """ Cached version of transformationFun(EC, column_index), returns list of token lists"""
+        entry = self.encodedTokens(EC, transformationFun, column_index, fingerprint, tokenizerName)
+        return DecodeTokenLists(entry["vocabulary"], entry["token_ids"], entry["offsets"])
+
+    def tokenBlocks(self, EC, transformationFun, column_index=None, fingerprint=None, tokenizerName=None):
+        """ Cached version of TokenBlocker(transformationFun(EC, column_index)), returns the same dictionary of token to entity indices"""
+        entry = self.encodedTokens(EC, transformationFun, column_index, fingerprint, tokenizerName)
+        vocabulary = entry["vocabulary"]
+        postingOffsets = entry["posting_offsets"]
+        postings = entry["postings"].tolist()
+        return {token: postings[postingOffsets[t]:postingOffsets[t+1]] for t, token in enumerate(vocabulary)}
+
+    def transformation(self, transformationFun, tokenizerName=None):
+        """ Wraps a transformation function (e.g. ColumnTokenizer) so that it reads and writes this cache.
+        The wrapper can be passed to TokenBlocking and AttributeClusteringBlocking in place of the original function."""
+        key = tokenizerName if tokenizerName is not None else _tokenizerName(transformationFun)
+        def cachedTransformation(EC, column_index=None):
+            return self.tokenize(EC, transformationFun, column_index, tokenizerName=key)
+        return cachedTransformation
+
+
+def CachedTokenBlocking(EntityCollection1, EntityCollection2, transformationFun, cache, column_index=None, fingerprints=(None, None), tokenizerName=None):
+    """ Same as TokenBlocking with TokenBlocker as constraint function, but tokens and token blocks of both collections come from the cache
+    and are joined to a BlockCollection without building the token dictionaries.
+    Fingerprints of the collections (e.g. FileFingerprint of the csv files) can be given to avoid hashing the arrays.
+    tokenizerName identifies transformationFun in the cache keys, it is required for lambdas, closures and partials (see TokenCache.key)."""
+    entry1 = cache.encodedTokens(EntityCollection1, transformationFun, column_index, fingerprints[0], tokenizerName)
+    entry2 = cache.encodedTokens(EntityCollection2, transformationFun, column_index, fingerprints[1], tokenizerName)
+    return(BlockCollection.fromPostings(entry1["vocabulary"], entry1["posting_offsets"], entry1["postings"],
+                                        entry2["vocabulary"], entry2["posting_offsets"], entry2["postings"],
+                                        len(EntityCollection1), len(EntityCollection2)))
@@ -0,0 +1,113 @@
+import os
+import atexit
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import nltk
+from nltk.stem import LancasterStemmer
+
+
+def _ensureNltkResource(path, name):
+    """ Downloads an NLTK resource only if it can not be found locally, so that worker processes do not hit the network on import."""
+    try:
+        nltk.data.find(path)
+    except LookupError:
+        nltk.download(name)
+
+_ensureNltkResource("corpora/stopwords", "stopwords")
+_ensureNltkResource("tokenizers/punkt", "punkt")
+from nltk.corpus import stopwords
+stop = stopwords.words('english')
+stopSet = frozenset(stop)
+lancaster = LancasterStemmer()
+
+# Settings that change the produced tokens, used to identify tokenizer output (e.g. in caches)
+TOKENIZER_SETTINGS = {"stemmer": "lancaster", "stopwords": "english", "min_token_length": 2}
+STEM_CACHE_SIZE = 2**18
+DEFAULT_CHUNK_SIZE = 5000
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def _stem(token):
+    """ Lancaster stemming with a bounded LRU cache. The cache is per process and shared by every column tokenized in it;
+    worker processes of the shared pool live across calls, so their caches are kept too."""
+    return lancaster.stem(token)
+
+def _tokenizeText(text):
+    """ Tokenizes a single string: lower case, drops stopwords and one character tokens and stems the remaining unique tokens.
+    Unique tokens keep their first occurrence order, so the result does not depend on the string hash seed of the process."""
+    tokens = nltk.word_tokenize(text.lower())
+    filtered = dict.fromkeys(token for token in tokens if token not in stopSet and len(token)>1)
+    return [_stem(token) for token in filtered]
+
+def _tokenizeChunk(texts):
+    """ Tokenizes a chunk of strings, this is the unit of work sent to the worker processes."""
+    return [_tokenizeText(text) for text in texts]
+
+def _chunks(texts, chunk_size):
+    for start in range(0, len(texts), chunk_size):
+        yield texts[start:start+chunk_size]
+
+# Worker pool shared by all tokenization calls of the process. It is created when first needed and kept alive,
+# so the stem caches of the workers stay warm from one column or collection to the next.
+_pool = None
+_poolSize = 0
+
+def _executor(workers):
+    """ Returns the shared pool, replaced by a larger one if it has fewer than workers processes.
+    A larger pool is kept, callers limit how many of its workers they use by the number of chunks they submit at a time."""
+    global _pool, _poolSize
+    if _pool is None or _poolSize < workers:
+        ShutdownPool()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _poolSize = workers
+    return _pool
+
+def ShutdownPool():
+    """ Shuts down the shared tokenization pool, e.g. to free the worker processes after the tokenization stage"""
+    global _pool, _poolSize
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+        _poolSize = 0
+
+atexit.register(ShutdownPool)
+
+def _tokenizeChunks(textChunks, processes):
+    """ Tokenizes chunks in the shared pool with at most processes chunks submitted at a time, so that no more than processes workers
+    are busy even if the pool is larger. Yields the token lists of each chunk in the input order."""
+    executor = _executor(processes)
+    pending = deque()
+    for texts in textChunks:
+        if len(pending) >= processes:
+            yield pending.popleft().result()
+        pending.append(executor.submit(_tokenizeChunk, texts))
+    while pending:
+        yield pending.popleft().result()
+
+def TokenizeTexts(texts, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Tokenizes a sequence of strings and returns list of token lists, one for each string, in the input order.
+    Input is split into chunks of chunk_size strings which are tokenized in the shared process pool with at most processes workers
+    (default is number of CPUs), and no more workers than chunks.
+    Small inputs that fit into one chunk, or processes=1, are tokenized in the calling process."""
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1 or len(texts) <= chunk_size:
+        return _tokenizeChunk(texts)
+    numChunks = -(-len(texts) // chunk_size)
+    tokenized = []
+    for chunk in _tokenizeChunks(_chunks(texts, chunk_size), min(processes, numChunks)):
+        tokenized.extend(chunk)
+    return tokenized
+
+def TokenizeStream(textChunks, processes=None):
+    """ Tokenizes an iterable of chunks of strings lazily, yielding the list of token lists of each chunk in the input order.
+    Chunks are tokenized in the shared process pool by at most processes workers (default is number of CPUs), one chunk per worker read ahead,
+    so the whole input is never held in memory. With processes=1 chunks are tokenized in the calling process."""
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1:
+        for texts in textChunks:
+            yield _tokenizeChunk(texts)
+        return
+    yield from _tokenizeChunks(textChunks, processes)
@@ -0,0 +1,71 @@
+import numpy as np
+import scipy.sparse as sp
+from Instrumentation import Instrumented, WeightCounts
+
+# Edge weighting schemes for the sparse blocking graph (SparseGraph.BlockingGraph).
+# Each scheme computes the weights of all edges with whole-array operations and returns them as a new array
+# in the order of the graph's edges; the graph itself is never modified.
+# Notation: B_i are the blocks of entity i, B_ij the blocks shared by i and j, B all blocks,
+# ||b|| the number of comparisons in block b and v_i the edges of node i.
+
+
+def CBSWeights(graph):
+    """ Common blocks scheme |B_ij|, normalized between [0, 1] by dividing with the largest value"""
+    return graph.commonBlocks / graph.maxCommonBlocks()
+
+def JaccardWeights(graph):
+    """ Jaccard scheme |B_ij| / (|B_i| + |B_j| - |B_ij|)"""
+    common = graph.commonBlocks
+    return common / (graph.blockCounts1[graph.rows] + graph.blockCounts2[graph.cols] - common)
+
+def ARCSWeights(graph):
+    """ Aggregate reciprocal comparisons scheme, sum of 1 / ||b|| over the common blocks b of the edge.
+    Computed as B1ᵀ·diag(1/||b||)·B2, which has the same nonzeros as the graph's common block counts."""
+    if graph.incidence1 is None or graph.incidence2 is None:
+        raise ValueError("ARCS weighting requires a graph built with block incidence matrices")
+    B1 = graph.incidence1
+    B2 = graph.incidence2
+    comparisons = np.asarray(B1.sum(axis=1)).ravel() * np.asarray(B2.sum(axis=1)).ravel()
+    inverse = np.zeros(len(comparisons))
+    np.divide(1.0, comparisons, out=inverse, where=comparisons > 0)
+    B1T = graph.transposedIncidence1()[graph.rowOffset:graph.rowOffset + graph.edges.shape[0]]
+    if graph.colOffset or graph.edges.shape[1] != B2.shape[1]:
+        B2 = B2.tocsc()[:, graph.colOffset:graph.colOffset + graph.edges.shape[1]]
+    arcs = (B1T @ sp.diags(inverse) @ B2).tocsr()
+    arcs.sort_indices()
+    if arcs.nnz != graph.numEdges:
+        raise ValueError("Incidence matrices do not match the edges of the graph")
+    return arcs.data
+
+def ECBSWeights(graph):
+    """ Enhanced common blocks scheme |B_ij| * log(|B| / |B_i|) * log(|B| / |B_j|)"""
+    numBlocks = graph.numBlocks
+    return (graph.commonBlocks
+            * np.log(numBlocks / graph.blockCounts1[graph.rows])
+            * np.log(numBlocks / graph.blockCounts2[graph.cols]))
+
+def EJSWeights(graph):
+    """ Enhanced Jaccard scheme JS_ij * log(|E| / |v_i|) * log(|E| / |v_j|)"""
+    numEdges = graph.totalEdges()
+    return (JaccardWeights(graph)
+            * np.log(numEdges / graph.degrees1()[graph.rows])
+            * np.log(numEdges / graph.degrees2()[graph.cols]))
+
+
+# Schemes that depend on the whole graph (largest common block count, node degrees), not only on the blocks of the edge's entities.
+# Weighting a chunk of a graph with these needs GraphStatistics of the whole graph.
+SCHEMES_WITH_GRAPH_STATISTICS = ('CBS', 'EJS')
+
+# Every scheme used through this table is an instrumented "weighting" stage (see Instrumentation.py)
+WEIGHTING_SCHEMES = {scheme: Instrumented("weighting", WeightCounts, scheme=scheme)(fun) for scheme, fun in (
+    ('CBS', CBSWeights),
+    ('JS', JaccardWeights),
+    ('ARCS', ARCSWeights),
+    ('ECBS', ECBSWeights),
+    ('EJS', EJSWeights))}
+
+def Weighting(graph, scheme):
+    """ Returns a graph sharing the topology of the given graph, weighted with the named scheme (one of WEIGHTING_SCHEMES)"""
+    if scheme not in WEIGHTING_SCHEMES:
+        raise ValueError("Unknown weighting scheme: {0}".format(scheme))
+    return graph.withWeights(WEIGHTING_SCHEMES[scheme](graph))
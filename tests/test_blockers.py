@@ -0,0 +1,25 @@
+from Blockers import _extendedQGrams, _qgrams, ExtendedQGramKeys
+
+
+def test_extended_qgrams_of_words_on_both_sides_of_max_qgrams():
+    # 11 q-grams, all combinations of at least 8 of them
+    short = _extendedQGrams("configuration", 3, 0.8, 11)
+    # 12 q-grams, more than max_qgrams, so fewer q-grams are left out
+    long = _extendedQGrams("configurations", 3, 0.8, 11)
+    assert set(_qgrams("configuration", 3)) <= set(short)
+    assert set(_qgrams("configurations", 3)) <= set(long)
+    # the concatenation of all q-grams of the shorter word leaves out only the last q-gram of the longer one
+    assert "".join(_qgrams("configuration", 3)) in long
+    assert len(set(short) & set(long)) > len(set(_qgrams("configuration", 3)))
+
+
+def test_extended_qgrams_of_long_words_are_bounded():
+    limit = len(_extendedQGrams("abcdefghijklmn", 3, 0.8, 12))
+    for word in ("abcdefghijklmno", "abcdefghijklmnopqrstuvwxyz"):
+        assert len(_extendedQGrams(word, 3, 0.8, 12)) <= limit + len(word)
+
+
+def test_extended_qgram_keys_block_variants_together():
+    keys1, keys2 = ExtendedQGramKeys(["microsoft configuration"], max_qgrams=11) + ExtendedQGramKeys(["configurations"], max_qgrams=11)
+    # besides the q-grams, the words share concatenations of q-grams
+    assert any(len(key) > 3 for key in set(keys1) & set(keys2))